@@ -2,11 +2,18 @@
 FreelanceHub - Main Application Entry Point
 Organized structure with blueprints for better maintainability
 """
-from flask import Flask
-from flask_session import Session
+from flask import Flask, render_template
+import logging
 import os
 
-from src.config.settings import config
+from src.config.settings import config, LOG_LEVEL
+from src.utils.database import init_db, close_db
+from src.utils.sessions import init_sessions
+from src.utils.http_cache import apply_cache_policy, asset_url
+from src.utils.embeddings import warm_up
+from src.utils.embedding_jobs import start_worker
+from src.utils.uploads import start_collector, UploadRequest
+from src.utils.resume_jobs import start_recovery
 from src.routes.auth import auth_bp
 from src.routes.buyer import buyer_bp
 from src.routes.seller import seller_bp
@@ -16,17 +23,32 @@ from src.routes.resume import resume_bp
 
 def create_app(config_name='development'):
     """Application factory pattern"""
+    # Does nothing if the server (e.g. gunicorn --log-config) already set up logging
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     app = Flask(__name__)
+    # Uploads stream to disk and are checked as they arrive (see upload_limit)
+    app.request_class = UploadRequest
     
     # Load configuration
     app.config.from_object(config[config_name])
     app.config["SESSION_FILE_DIR"] = os.path.join(app.root_path, "flask_session")
     
     # Initialize extensions
-    Session(app)
+    init_db()
+    init_sessions(app)
+    app.teardown_appcontext(close_db)
+    if app.config["WARM_UP_SEARCH"]:
+        warm_up()
+    if app.config["EMBEDDING_WORKER"]:
+        start_worker()
+    if app.config["UPLOAD_GC"]:
+        start_collector()
+    # Resume extractions interrupted by a restart
+    start_recovery()
     
     # Configure Flask
     app.jinja_env.auto_reload = True
+    app.jinja_env.filters["asset_url"] = asset_url
     
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -36,13 +58,14 @@ def create_app(config_name='development'):
     app.register_blueprint(chat_bp)
     app.register_blueprint(resume_bp)
     
-    @app.after_request
-    def after_request(response):
-        """Ensure responses aren't cached"""
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Expires"] = 0
-        response.headers["Pragma"] = "no-cache"
-        return response
+    # Pages aren't cached; static assets and JSON APIs follow their own policy
+    app.after_request(apply_cache_policy)
+
+    @app.errorhandler(413)
+    @app.errorhandler(415)
+    def upload_rejected(error):
+        """Oversized or wrong-type uploads"""
+        return render_template("error.html", error=error.description), error.code
     
     return app
 
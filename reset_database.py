@@ -20,14 +20,23 @@ def clear_all_data():
     conn = sqlite3.connect('project.db')
     cursor = conn.cursor()
     
-    # Get all tables
-    tables = cursor.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+    # Get all tables; the migration history describes the schema, which stays,
+    # and the full-text index's shadow tables are its storage, not data
+    tables = cursor.execute("""
+        SELECT name FROM sqlite_master WHERE type='table'
+        AND name != 'schema_migrations' AND name NOT LIKE 'services\\_fts\\_%' ESCAPE '\\';
+    """).fetchall()
     
     print("\n🗑️  Clearing all data...")
     for table in tables:
         table_name = table[0]
         cursor.execute(f"DELETE FROM {table_name}")
         print(f"  ✓ Cleared {table_name}")
+
+    # Rebuild the full-text index from what is left
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'services_fts'").fetchone():
+        cursor.execute("INSERT INTO services_fts(services_fts) VALUES('rebuild')")
+        print("  ✓ Rebuilt services_fts")
     
     conn.commit()
     conn.close()
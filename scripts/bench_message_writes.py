@@ -0,0 +1,146 @@
+"""
+Chat Write Benchmark for FreelanceHub
+Compares message-send throughput of one transaction per send (the old path)
+with the group-commit MessageWriter, using concurrent sender threads against
+a scratch copy of the schema.
+
+Usage:
+    python scripts/bench_message_writes.py
+    python scripts/bench_message_writes.py --threads 32 --sends 200
+    python scripts/bench_message_writes.py --profile durable --window 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.utils import database
+from src.utils.database import get_db_connection, init_db
+from src.utils.message_writer import MessageWriter, insert_message
+
+# The original tables the app schema and migrations build on
+BASE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    is_buyer INTEGER DEFAULT 0,
+    is_seller INTEGER DEFAULT 0,
+    resume TEXT DEFAULT NULL,
+    preferences TEXT
+);
+CREATE TABLE services (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price REAL,
+    tag TEXT DEFAULT NULL,
+    image_url TEXT
+);
+CREATE TABLE conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service_id INTEGER NOT NULL,
+    buyer_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(service_id, buyer_id)
+);
+CREATE TABLE chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    is_read INTEGER DEFAULT 0
+);
+CREATE TABLE notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_read INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def setup(path, conversations):
+    """Scratch database with two users and ``conversations`` conversations between them"""
+    database.DATABASE = path
+    conn = get_db_connection()
+    conn.executescript(BASE_SCHEMA)
+    conn.execute("INSERT INTO users (username, password) VALUES ('buyer', ''), ('seller', '')")
+    conn.execute("INSERT INTO services (user_id, title, description) VALUES (2, 'Bench', 'Bench')")
+    conn.executemany("INSERT INTO conversations (service_id, buyer_id, seller_id) VALUES (?, 1, 2)",
+                     [(-n,) for n in range(conversations)])
+    conn.commit()
+    conn.close()
+    init_db()
+
+def run(threads, sends, send):
+    """Time ``threads`` senders each calling ``send(conn, n)`` ``sends`` times"""
+    errors = []
+
+    def sender(worker):
+        conn = get_db_connection()
+        try:
+            for n in range(sends):
+                send(conn, worker * sends + n)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=sender, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f"   ⚠️  {len(errors)} sender(s) failed, first error: {errors[0]}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent senders")
+    parser.add_argument("--sends", type=int, default=100, help="messages per sender")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--window", type=float, default=5, help="group-commit window in ms")
+    parser.add_argument("--profile", default=None, help="SQLITE_PRAGMA_PROFILES entry to use")
+    args = parser.parse_args()
+
+    if args.profile:
+        database.SQLITE_PRAGMA_PROFILE = args.profile
+    total = args.threads * args.sends
+
+    def send_args(n):
+        return (n % args.conversations + 1, 1, 2, f"message {n}", "New message from buyer")
+
+    def direct(conn, n):
+        insert_message(conn, *send_args(n))
+        conn.commit()
+
+    print(f"\n💬 {args.threads} senders × {args.sends} messages, profile {database.SQLITE_PRAGMA_PROFILE}")
+    with tempfile.TemporaryDirectory() as scratch:
+        setup(os.path.join(scratch, "per_send.db"), args.conversations)
+        direct_s = run(args.threads, args.sends, direct)
+
+        # The writer opens its connection when it starts, so start it on its own database
+        setup(os.path.join(scratch, "group_commit.db"), args.conversations)
+        # Same pragmas as the per-send path, so only the batching differs
+        writer = MessageWriter(window_ms=args.window, profile=database.SQLITE_PRAGMA_PROFILE)
+        writer.start()
+        grouped_s = run(args.threads, args.sends, lambda conn, n: writer.submit(*send_args(n)).result())
+
+    for name, elapsed in (("per-send commit", direct_s), ("group commit", grouped_s)):
+        print(f"   {name:<16} {elapsed:7.2f}s  {total / elapsed:9.0f} msg/s")
+    print(f"\n   Speedup: {direct_s / grouped_s:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Session Backend Benchmark for FreelanceHub
+Times logged-in requests through each SESSION_BACKEND ("filesystem",
+"sqlite", "cookie") with the Flask test client, against a scratch copy of
+the schema. Each round reads the session on most requests and changes it on
+some, like switching between the buyer and seller views.
+
+Usage:
+    python scripts/bench_sessions.py
+    python scripts/bench_sessions.py --requests 5000 --write-every 10
+    python scripts/bench_sessions.py --backends sqlite cookie --users 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask, session
+from src.utils import database
+from src.utils.database import get_db, get_db_connection, init_db, close_db
+from src.utils.sessions import init_sessions
+from bench_message_writes import BASE_SCHEMA
+
+BACKENDS = ["filesystem", "sqlite", "cookie"]
+
+def make_app(backend, scratch):
+    """A bare app with one reading and one writing route on ``backend``"""
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="bench", SESSION_BACKEND=backend, SESSION_PERMANENT=True,
+                      SESSION_TYPE="filesystem", SESSION_FILE_DIR=os.path.join(scratch, "flask_session"))
+    init_sessions(app)
+    app.teardown_appcontext(close_db)
+
+    @app.route("/login/<int:user_id>")
+    def login(user_id):
+        session["user_id"] = user_id
+        session["username"] = f"user{user_id}"
+        session["profile_type"] = "buyer"
+        return "ok"
+
+    # Like every page of the app, these use the request's database connection,
+    # so only the session backend's own cost differs between backends
+    @app.route("/read")
+    def read():
+        get_db()
+        return str(session["user_id"])
+
+    @app.route("/switch")
+    def switch():
+        get_db()
+        session["profile_type"] = "seller" if session["profile_type"] == "buyer" else "buyer"
+        return "ok"
+
+    return app
+
+def run(app, users, requests, write_every):
+    """Log ``users`` clients in, then spread ``requests`` requests across them"""
+    clients = [app.test_client() for _ in range(users)]
+    for user_id, client in enumerate(clients, 1):
+        client.get(f"/login/{user_id}")
+    start = time.perf_counter()
+    for n in range(requests):
+        client = clients[n % users]
+        client.get("/switch" if write_every and n % write_every == 0 else "/read")
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--users", type=int, default=100, help="concurrently logged-in clients")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-every", type=int, default=20,
+                        help="every Nth request changes the session (0 = never)")
+    args = parser.parse_args()
+
+    print(f"\n🍪 {args.requests} requests over {args.users} sessions, "
+          f"1 in {args.write_every or '∞'} writes")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        # The sqlite backend needs the sessions table, which migrations create
+        database.DATABASE = os.path.join(scratch, "sessions.db")
+        conn = get_db_connection()
+        conn.executescript(BASE_SCHEMA)
+        init_db()
+        # Held open like the app's background workers do; otherwise every
+        # request closing the last connection would checkpoint the WAL
+        for backend in args.backends:
+            results[backend] = run(make_app(backend, scratch), args.users, args.requests, args.write_every)
+        conn.close()
+
+    baseline = results.get("filesystem")
+    for backend, elapsed in results.items():
+        line = f"   {backend:<11} {elapsed:7.2f}s  {args.requests / elapsed:8.0f} req/s"
+        if baseline:
+            line += f"  {baseline / elapsed:5.1f}x"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Image Variant Backfill for FreelanceHub
+Builds the catalogue thumbnail and WebP copy for services whose image was
+uploaded before variants existed (or whose variants failed to build).
+
+Usage:
+    python scripts/build_image_variants.py
+    python scripts/build_image_variants.py --all   # rebuild every service image
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from src.utils.database import get_db_connection, init_db
+from src.utils.images import get_pool, process_service_image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="rebuild variants that already exist too")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db_connection()
+    rows = conn.execute(f"""
+        SELECT id, image_url FROM services
+        WHERE image_url IS NOT NULL {"" if args.all else "AND thumbnail_url IS NULL"}
+    """).fetchall()
+    conn.close()
+
+    # Stored URLs are "/<path relative to the app root>"
+    jobs = [(row["id"], row["image_url"].lstrip("/")) for row in rows]
+    missing = [service_id for service_id, path in jobs if not os.path.isfile(path)]
+    jobs = [(service_id, path) for service_id, path in jobs if os.path.isfile(path)]
+
+    print(f"\n🖼️  Building variants for {len(jobs)} service image(s)")
+    if missing:
+        print(f"   ⚠️  {len(missing)} image file(s) not found, skipped: {missing[:10]}")
+    start = time.perf_counter()
+    futures = [get_pool().submit(process_service_image, service_id, path) for service_id, path in jobs]
+    for future in futures:
+        future.result()
+    print(f"   ✅ Done in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup Profiler for FreelanceHub
+Measures import time per module and the time create_app() takes, so that
+heavy imports creeping back into the startup path are easy to spot.
+
+Usage:
+    python scripts/profile_startup.py              # top 25 modules
+    python scripts/profile_startup.py --top 50
+    python scripts/profile_startup.py --budget 1.5 # exit 1 if startup > 1.5s
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so nothing is already imported
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+from app_new import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(f"STARTUP {imported - start:.6f} {done - imported:.6f}")
+"""
+
+def run_profile():
+    """Run the app factory under -X importtime and return (imports, timings)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    import_s, create_app_s = None, None
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            import_s, create_app_s = (float(v) for v in line.split()[1:])
+    return imports, import_s, create_app_s
+
+def summarize(imports, top):
+    """Print the slowest modules and the total self time per top-level package"""
+    by_package = defaultdict(int)
+    for name, self_us, _ in imports:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"\n📦 Slowest top-level packages (self time):")
+    for package, us in sorted(by_package.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f"  {us / 1000:9.1f} ms  {package}")
+
+    print(f"\n🧩 Application modules (cumulative time):")
+    for name, _, cumulative_us in imports:
+        if name == "app_new" or name.startswith("src"):
+            print(f"  {cumulative_us / 1000:9.1f} ms  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=25, help="number of packages to list")
+    parser.add_argument("--budget", type=float, help="fail if import + create_app exceeds this many seconds")
+    args = parser.parse_args()
+
+    imports, import_s, create_app_s = run_profile()
+    summarize(imports, args.top)
+
+    total = import_s + create_app_s
+    print("\n" + "=" * 50)
+    print(f"⏱️  Import app_new: {import_s:.3f}s")
+    print(f"⏱️  create_app():   {create_app_s:.3f}s")
+    print(f"⏱️  Total startup:  {total:.3f}s")
+    print("=" * 50)
+
+    if args.budget is not None and total > args.budget:
+        print(f"\n❌ Startup {total:.3f}s exceeds budget of {args.budget:.3f}s")
+        sys.exit(1)
@@ -1,4 +1,20 @@
 """Configuration package"""
 from .settings import *
 
-__all__ = ['SERVICE_TAGS', 'UPLOAD_FOLDER']
+__all__ = [
+    'SERVICE_TAGS', 'UPLOAD_FOLDER', 'LOG_LEVEL', 'PAGE_SIZE', 'MESSAGE_PAGE_SIZE', 'LONG_POLL_SECONDS',
+    'SEARCH_BACKEND', 'ANN_NPROBE', 'RESUME_SCORE_WEIGHT',
+    'HYBRID_FUSION', 'HYBRID_SEMANTIC_WEIGHT', 'HYBRID_KEYWORD_WEIGHT', 'HYBRID_CANDIDATES',
+    'QUERY_CACHE_SIZE', 'QUERY_CACHE_TTL',
+    'EMBEDDING_BATCH_SIZE', 'EMBEDDING_POLL_SECONDS',
+    'MESSAGE_GROUP_COMMIT', 'MESSAGE_COMMIT_WINDOW_MS', 'MESSAGE_COMMIT_BATCH',
+    'PUBSUB_BACKEND', 'REDIS_URL', 'PUBSUB_PREFIX',
+    'SQLITE_PRAGMA_PROFILES', 'SQLITE_PRAGMA_PROFILE', 'SQLITE_REUSE_CONNECTIONS',
+    'SESSION_BACKEND', 'SESSION_CACHE_SIZE', 'SESSION_CACHE_TTL',
+    'SESSION_REFRESH_SECONDS', 'SESSION_SWEEP_SECONDS',
+    'STATIC_CACHE_SECONDS',
+    'THUMBNAIL_SIZE', 'IMAGE_DISPLAY_MAX', 'IMAGE_WEBP_QUALITY', 'IMAGE_WORKERS',
+    'UPLOAD_GC_SECONDS', 'UPLOAD_GC_GRACE_SECONDS',
+    'RESUME_WORKERS', 'RESUME_TIMEOUT_SECONDS', 'RESUME_MAX_PAGES', 'RESUME_MAX_CHARS',
+    'MAX_REQUEST_BYTES', 'SERVICE_IMAGE_MAX_BYTES', 'RESUME_FILE_MAX_BYTES',
+]
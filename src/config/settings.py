@@ -21,14 +21,133 @@ SERVICE_TAGS = [
     "AI & Data",
 ]
 
+# Services shown per page on the buyer dashboard and search results
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "24"))
+
+# Chat messages returned per page by the messages API
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+# Group commit for chat sends: concurrent sends within the window share one transaction
+MESSAGE_GROUP_COMMIT = os.getenv("MESSAGE_GROUP_COMMIT", "1") == "1"
+MESSAGE_COMMIT_WINDOW_MS = float(os.getenv("MESSAGE_COMMIT_WINDOW_MS", "5"))
+MESSAGE_COMMIT_BATCH = int(os.getenv("MESSAGE_COMMIT_BATCH", "256"))
+# Chat push fan-out: "local" reaches this process only, "redis" reaches every worker
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "local")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PUBSUB_PREFIX = os.getenv("PUBSUB_PREFIX", "freelancehub:")
+# Longest a chat long-poll request waits for a new message before returning empty
+LONG_POLL_SECONDS = float(os.getenv("LONG_POLL_SECONDS", "25"))
+
+# Level for the application's loggers (background workers, migrations, uploads)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Search backend: "exact" scans every stored embedding, "ann" uses the IVF index
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "exact")
+# Clusters probed per ANN query; higher means better recall and slower queries
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# Hybrid search defaults: "rrf" or "weighted" fusion, list weights, candidates per list
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+HYBRID_SEMANTIC_WEIGHT = float(os.getenv("HYBRID_SEMANTIC_WEIGHT", "0.7"))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "0.3"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "200"))
+
+# Share of a service's score that comes from its seller's resume (0 disables it)
+RESUME_SCORE_WEIGHT = float(os.getenv("RESUME_SCORE_WEIGHT", "0.3"))
+
+# Query embedding cache: entries kept and seconds before an entry is re-encoded
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# Background embedding worker: jobs encoded per model call and idle poll interval
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_POLL_SECONDS = float(os.getenv("EMBEDDING_POLL_SECONDS", "2"))
+
+# SQLite pragmas applied to every connection, by profile. WAL lets readers run
+# alongside the single writer and busy_timeout makes writers queue instead of
+# failing with "database is locked"; cache_size is in KiB when negative.
+SQLITE_PRAGMA_PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "mmap_size": 134217728,
+    },
+    # Same as "wal" but fsyncs every commit
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "mmap_size": 134217728,
+    },
+}
+SQLITE_PRAGMA_PROFILE = os.getenv("SQLITE_PRAGMA_PROFILE", "wal")
+# Keep one connection per worker thread across requests instead of reconnecting
+SQLITE_REUSE_CONNECTIONS = os.getenv("SQLITE_REUSE_CONNECTIONS", "0") == "1"
+
+# Where session data lives: "sqlite" (server-side, LRU-cached), "cookie"
+# (signed cookie, needs a SECRET_KEY shared by every worker) or "filesystem"
+# (the old Flask-Session store)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+# In-process cache in front of the sessions table for sessions without a
+# signed-in user; 0 disables it. Other worker processes see a change to one
+# after at most SESSION_CACHE_TTL
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "5"))
+# Push an unchanged session's expiry forward at most this often
+SESSION_REFRESH_SECONDS = int(os.getenv("SESSION_REFRESH_SECONDS", "3600"))
+# Delete expired session rows at most this often
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", "600"))
+
+# Browser cache lifetime for static files linked with a content hash (asset_url)
+STATIC_CACHE_SECONDS = int(os.getenv("STATIC_CACHE_SECONDS", str(365 * 24 * 3600)))
+
+# Service image variants: catalogue thumbnail (width, height, cropped to fill)
+# and the longest side of the WebP shown on the service page
+THUMBNAIL_SIZE = tuple(int(n) for n in os.getenv("THUMBNAIL_SIZE", "640x320").split("x"))
+IMAGE_DISPLAY_MAX = int(os.getenv("IMAGE_DISPLAY_MAX", "1600"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+# Threads building image variants off the request thread
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# How often unreferenced uploads are collected, and how long one must have
+# been unreferenced first (covers storing a file before saving its row)
+UPLOAD_GC_SECONDS = int(os.getenv("UPLOAD_GC_SECONDS", "600"))
+UPLOAD_GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", "300"))
+
+# Resume PDF extraction runs in this many worker processes, each document
+# limited in run time, pages read and characters kept
+RESUME_WORKERS = int(os.getenv("RESUME_WORKERS", "2"))
+RESUME_TIMEOUT_SECONDS = float(os.getenv("RESUME_TIMEOUT_SECONDS", "20"))
+RESUME_MAX_PAGES = int(os.getenv("RESUME_MAX_PAGES", "20"))
+RESUME_MAX_CHARS = int(os.getenv("RESUME_MAX_CHARS", "50000"))
+
+# Largest request body accepted anywhere, and the per-file limits of the
+# upload endpoints (which set their own body limit from these)
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+SERVICE_IMAGE_MAX_BYTES = int(os.getenv("SERVICE_IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESUME_FILE_MAX_BYTES = int(os.getenv("RESUME_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+
 # Flask configuration
 class Config:
     """Base configuration"""
     SECRET_KEY = os.getenv('SECRET_KEY', os.urandom(24).hex())
     SESSION_PERMANENT = True
     UPLOAD_FOLDER = UPLOAD_FOLDER
+    SESSION_BACKEND = SESSION_BACKEND
+    # Only used by the "filesystem" session backend
     SESSION_TYPE = "filesystem"
     TEMPLATES_AUTO_RELOAD = True
+    MAX_CONTENT_LENGTH = MAX_REQUEST_BYTES
+    # Read by the chat API and rendered into the page's polling script
+    LONG_POLL_SECONDS = LONG_POLL_SECONDS
+    WARM_UP_SEARCH = False
+    # Run the background embedding worker thread in this process
+    EMBEDDING_WORKER = True
+    # Run the orphaned-upload collector thread in this process
+    UPLOAD_GC = True
     
     # Stripe configuration
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
@@ -41,6 +160,8 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    # Load the embedding model before serving so the first search isn't slow
+    WARM_UP_SEARCH = True
 
 # Select config based on environment
 config = {
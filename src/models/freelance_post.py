@@ -1,7 +1,8 @@
 """Freelance Post model"""
 
 class freelance_post:
-    def __init__(self, title, description, price, id, resume, seller_username, image_url=None):
+    def __init__(self, title, description, price, id, resume, seller_username, image_url=None,
+                 thumbnail_url=None):
         self.title = title
         self.description = description
         self.price = price
@@ -9,6 +10,8 @@ class freelance_post:
         self.resume = resume
         self.seller_username = seller_username
         self.image_url = image_url or "/static/default_image.png"
+        # Catalogue-sized copy once the image workers have made it
+        self.thumbnail_url = thumbnail_url or self.image_url
 
     def post(self):
         return f"Post(title = {self.title}, content = {self.description})"
@@ -2,7 +2,7 @@
 from flask import Blueprint, render_template, request, session, redirect
 from werkzeug.security import generate_password_hash, check_password_hash
 from src.models import Profile
-from src.utils.database import get_db_connection
+from src.utils.database import get_db
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -16,8 +16,7 @@ def home():
         return redirect("/")
     
     user_profile = Profile(session["username"], session.get("profile_type", "buyer"), 
-                          session.get("password"), session["user_id"], 
-                          resume=session.get("resume", ""))
+                          None, session["user_id"])
     return render_template("home.html", profile=user_profile)
 
 @auth_bp.route("/logout")
@@ -32,7 +31,7 @@ def register():
         password = request.form.get("password")
         password_confirm = request.form.get("confirmation")
 
-        db = get_db_connection()
+        db = get_db()
         cursor = db.cursor()
 
         if not name:
@@ -65,11 +64,8 @@ def register():
         session["user_id"] = rows[0]["id"]
         session["username"] = name
         session["profile_type"] = user_profile.profile_type
-        session["password"] = user_profile.password
-        session["resume"] = user_profile.resume
 
         cursor.close()
-        db.close()
 
         return redirect("/home")
     else:
@@ -87,14 +83,13 @@ def login():
         if not password:
             return render_template("error.html", error="Please enter password")
         
-        db = get_db_connection()
+        db = get_db()
         cursor = db.cursor()
 
         user = cursor.execute("SELECT * FROM users WHERE username = ?", (name,)).fetchone()
 
         if not user or not check_password_hash(user["password"], password):
             cursor.close()
-            db.close()
             return render_template("error.html", error="Invalid username or password")
 
         session["user_id"] = user["id"]
@@ -103,17 +98,12 @@ def login():
         if user["is_buyer"] == 1:
             user_profile = Profile(name, "buyer", user["password"], user["id"], resume=user["resume"])
             session["profile_type"] = user_profile.profile_type
-            session["password"] = user_profile.password
-            session["resume"] = user_profile.resume
 
         if user["is_seller"] == 1:
             user_profile = Profile(name, "seller", user["password"], user["id"], resume=user["resume"])
             session["profile_type"] = user_profile.profile_type
-            session["password"] = user_profile.password
-            session["resume"] = user_profile.resume
 
         cursor.close()
-        db.close()
         
         return redirect("/home")
     else:
@@ -1,55 +1,95 @@
 """Buyer-related routes"""
-from flask import Blueprint, render_template, request, session, redirect
+from flask import Blueprint, render_template, request, session, redirect, url_for
 import json
 from src.models import Profile, freelance_post
-from src.utils.database import get_db_connection
-from src.utils.search_engine import SearchQuery
-from src.config import SERVICE_TAGS
+from src.utils.database import get_db
+from src.utils.embedding_jobs import index_status
+from src.utils.search_engine import SearchQuery, HybridSearch, keyword_search, filter_clause
+from src.utils.recommendations import ensure_feed, prune_feeds
+from src.config import SERVICE_TAGS, PAGE_SIZE
 
 buyer_bp = Blueprint('buyer', __name__)
 
-def recommend(posts):
-    """Recommend posts based on user preferences"""
-    db = get_db_connection()
-    cursor = db.cursor()
-    row = cursor.execute("SELECT preferences FROM users WHERE id = ?", (session["user_id"],)).fetchone()
-    preferences = json.loads(row["preferences"]) if row and row["preferences"] else []
-    cursor.close()
-    db.close()
-    
-    engine = SearchQuery(posts)
-
-    if preferences:
-        query = " ".join(preferences)
-        results = engine.search(query)
-        items_ranked = [item for item, score in results]
+# Search scores stored embeddings, so listings don't need the seller's resume
+SERVICE_COLUMNS = """
+    services.id, services.title, services.description, services.price, services.image_url,
+    services.thumbnail_url, users.username
+"""
+
+def post_from_row(row):
+    return freelance_post(row["title"], row["description"], row["price"], row["id"],
+                          None, row["username"], row["image_url"], row["thumbnail_url"])
+
+def fetch_posts(cursor, service_ids):
+    """Load posts for ``service_ids``, keeping their order"""
+    if not service_ids:
+        return []
+    placeholders = ",".join("?" * len(service_ids))
+    rows = cursor.execute(f"""
+        SELECT {SERVICE_COLUMNS}
+        FROM services
+        JOIN users ON services.user_id = users.id
+        WHERE services.id IN ({placeholders})
+    """, list(service_ids)).fetchall()
+    by_id = {row["id"]: row for row in rows}
+    return [post_from_row(row) for row in (by_id.get(i) for i in service_ids) if row is not None]
+
+def current_page():
+    """1-based page number from the query string"""
+    return max(request.args.get("page", 1, type=int), 1)
+
+def page_url(page):
+    """The current URL with only the page number changed"""
+    return url_for(request.endpoint, **{**request.args.to_dict(), "page": page})
+
+def recommend(cursor, user_id, preferences, limit=-1, offset=0):
+    """Recommend posts based on user preferences, read from the precomputed ranking
+
+    Until the ranking for these preferences has been built, the newest
+    services are shown instead.
+    """
+    pref_key = ensure_feed(cursor.connection, preferences) if preferences else None
+    if pref_key:
+        services = cursor.execute(f"""
+            SELECT {SERVICE_COLUMNS}
+            FROM recommendation_rankings
+            JOIN services ON services.id = recommendation_rankings.service_id
+            JOIN users ON services.user_id = users.id
+            WHERE recommendation_rankings.pref_key = ? AND services.user_id != ?
+            ORDER BY recommendation_rankings.score DESC, recommendation_rankings.service_id DESC
+            LIMIT ? OFFSET ?
+        """, (pref_key, user_id, limit, offset)).fetchall()
     else:
-        items_ranked = posts
+        services = cursor.execute(f"""
+            SELECT {SERVICE_COLUMNS}
+            FROM services
+            JOIN users ON services.user_id = users.id
+            WHERE services.user_id != ?
+            ORDER BY services.id DESC
+            LIMIT ? OFFSET ?
+        """, (user_id, limit, offset)).fetchall()
 
-    return items_ranked
+    return [post_from_row(row) for row in services]
 
 @buyer_bp.route("/buyer", methods=["GET"])
 def buyer():
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
     user_id = session["user_id"]
 
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
-    services = cursor.execute("""
-        SELECT services.id, services.title, services.description, services.price, services.image_url,
-               users.resume, users.username
-        FROM services
-        JOIN users ON services.user_id = users.id
-        WHERE services.user_id != ?
-    """, (user_id,)).fetchall()
-    posts = [freelance_post(row["title"], row["description"], row["price"], row["id"], 
-                           row["resume"], row["username"], row["image_url"]) for row in services]
-    ranked_items = recommend(posts)
+                          session["user_id"])
 
-    # Get user preferences for highlighting (single category only)
     row = cursor.execute("SELECT preferences FROM users WHERE id = ?", (user_id,)).fetchone()
     user_preferences = json.loads(row["preferences"]) if row and row["preferences"] else []
+    page = current_page()
+    # One extra row tells us whether there is a next page
+    ranked_items = recommend(cursor, user_id, user_preferences,
+                             limit=PAGE_SIZE + 1, offset=(page - 1) * PAGE_SIZE)
+    has_next = len(ranked_items) > PAGE_SIZE
+    ranked_items = ranked_items[:PAGE_SIZE]
+
+    # Highlight the selected category (single category only)
     active_category = user_preferences[0] if user_preferences else None
     
     # Reorder tags to put active category first
@@ -59,11 +99,14 @@ def buyer():
         reordered_tags.insert(0, active_category)
 
     cursor.close()
-    db.close()
 
-    session["profile_type"] = "buyer"
+    # Assigning marks the session modified, which costs a session write
+    if session.get("profile_type") != "buyer":
+        session["profile_type"] = "buyer"
     return render_template("mainpage_buyer.html", items=ranked_items, profile=user_profile, 
-                          tags=reordered_tags, selected_category=active_category)
+                          tags=reordered_tags, selected_category=active_category,
+                          query=None, mode=None, page=page, has_next=has_next,
+                          page_url=page_url)
 
 @buyer_bp.route("/set_preferences", methods=["GET", "POST"])
 def set_preferences():
@@ -76,37 +119,69 @@ def set_preferences():
 
     preferences_str = json.dumps(preferences)
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
     cursor.execute("UPDATE users SET preferences = ? WHERE id = ?", 
                   (preferences_str, session["user_id"]))
     db.commit()
+
+    # Queue the new feed now rather than on the next /buyer visit
+    if preferences:
+        ensure_feed(db, preferences)
+    prune_feeds(db)
     cursor.close()
-    db.close()
 
     return redirect("/buyer")
 
 @buyer_bp.route("/search", methods=["GET", "POST"])
 def search():
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
     
-    services = cursor.execute("""SELECT services.id, services.title, services.description, services.price, 
-                                services.image_url, users.resume, users.username FROM services
-                                JOIN users ON services.user_id = users.id""").fetchall()
-    posts = [freelance_post(row["title"], row["description"], row["price"], row["id"], 
-                           row["resume"], row["username"], row["image_url"]) for row in services]
-    engine = SearchQuery(posts)
     query = request.args.get("query")
-
-    if query:
-        results = engine.search(query)
-        items_ranked = [item for item, score in results]
+    mode = request.args.get("mode", "semantic")
+    page = current_page()
+    offset = (page - 1) * PAGE_SIZE
+
+    # Filters run in SQL, so only the surviving services are ever scored
+    min_price = request.args.get("min_price", type=float)
+    max_price = request.args.get("max_price", type=float)
+    tag = request.args.get("tag") or None
+    filters = filter_clause(min_price, max_price, tag)
+    where, params = filters
+
+    if query and mode == "keyword":
+        results = keyword_search(db, query, limit=PAGE_SIZE + 1, offset=offset, filters=filters)
+        items_ranked = fetch_posts(cursor, [service_id for service_id, score in results])
+    elif query:
+        if mode == "hybrid":
+            # Fusion method and list weights can be tuned per request
+            engine = HybridSearch(fusion=request.args.get("fusion"),
+                                  semantic_weight=request.args.get("w_sem", type=float),
+                                  keyword_weight=request.args.get("w_lex", type=float),
+                                  filters=filters)
+        else:
+            engine = SearchQuery(filters)
+        results = engine.search(query, limit=PAGE_SIZE + 1, offset=offset)
+        items_ranked = fetch_posts(cursor, [service_id for service_id, score in results])
     else:
-        items_ranked = posts
+        services = cursor.execute(f"""SELECT {SERVICE_COLUMNS} FROM services
+                                    JOIN users ON services.user_id = users.id
+                                    WHERE {where}
+                                    ORDER BY services.id DESC
+                                    LIMIT ? OFFSET ?""", (*params, PAGE_SIZE + 1, offset)).fetchall()
+        items_ranked = [post_from_row(row) for row in services]
+    has_next = len(items_ranked) > PAGE_SIZE
+    items_ranked = items_ranked[:PAGE_SIZE]
+
+    # Semantic scores for services still pending (or failed) re-embedding come from their old text
+    stale_ids = set()
+    if query and mode != "keyword":
+        statuses = index_status(db, [item.id for item in items_ranked])
+        stale_ids = {service_id for service_id, status in statuses.items() if status != "fresh"}
 
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
+                          session["user_id"])
     
     # Get user preferences for consistency with buyer route
     user_id = session["user_id"]
@@ -115,7 +190,9 @@ def search():
     active_category = user_preferences[0] if user_preferences else None
     
     cursor.close()
-    db.close()
 
     return render_template("mainpage_buyer.html", items=items_ranked, profile=user_profile, 
-                          tags=SERVICE_TAGS, selected_category=active_category)
+                          tags=SERVICE_TAGS, selected_category=active_category,
+                          query=query, mode=mode, page=page, has_next=has_next,
+                          page_url=page_url, min_price=min_price, max_price=max_price,
+                          tag=tag, stale_ids=stale_ids)
@@ -1,7 +1,11 @@
 """Chat and messaging routes"""
-from flask import Blueprint, render_template, request, session, redirect, jsonify
+from flask import Blueprint, current_app, render_template, request, session, redirect, jsonify
 from src.models import Profile
-from src.utils.database import get_db_connection
+from src.utils.database import get_db, close_db
+from src.utils.pubsub import subscribe, conversation_channel
+from src.utils.message_writer import send_message
+from src.utils.http_cache import make_etag, not_modified, revalidate
+from src.config import MESSAGE_PAGE_SIZE
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -12,10 +16,27 @@ def api_conversations():
     if not user_id:
         return jsonify({"conversations": []}), 401
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
-    # Get conversations where user is either buyer or seller
+    # The inbox only changes with new messages, read cursors or service titles,
+    # so check those before building the full listing
+    version = cursor.execute("""
+        SELECT cs.conversation_id, cs.last_message_id, cs.unread_count, s.title
+        FROM conversation_summaries cs
+        JOIN conversations c ON c.id = cs.conversation_id
+        JOIN services s ON c.service_id = s.id
+        WHERE cs.user_id = ?
+        ORDER BY cs.last_timestamp DESC
+        LIMIT 10
+    """, (user_id,)).fetchall()
+    etag = make_etag(user_id, [tuple(row) for row in version])
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        cursor.close()
+        return unchanged
+
+    # Get conversations where user is either buyer or seller, newest first
     conversations = cursor.execute("""
         SELECT 
             c.id AS conversation_id,
@@ -25,28 +46,18 @@ def api_conversations():
             seller.username AS seller_username,
             s.title AS service_title,
             m.message AS last_message,
-            m.timestamp AS last_timestamp,
-            (
-                SELECT COUNT(*) 
-                FROM chat_messages 
-                WHERE conversation_id = c.id
-                AND sender_id != ?
-                AND is_read = 0
-            ) AS unread_count
-        FROM conversations c
+            cs.last_timestamp,
+            cs.unread_count
+        FROM conversation_summaries cs
+        JOIN conversations c ON c.id = cs.conversation_id
         JOIN users buyer ON c.buyer_id = buyer.id
         JOIN users seller ON c.seller_id = seller.id
         JOIN services s ON c.service_id = s.id
-        LEFT JOIN chat_messages m ON m.id = (
-            SELECT id FROM chat_messages
-            WHERE conversation_id = c.id
-            ORDER BY timestamp DESC
-            LIMIT 1
-        )
-        WHERE c.buyer_id = ? OR c.seller_id = ?
-        ORDER BY last_timestamp DESC
+        LEFT JOIN chat_messages m ON m.id = cs.last_message_id
+        WHERE cs.user_id = ?
+        ORDER BY cs.last_timestamp DESC
         LIMIT 10
-    """, (user_id, user_id, user_id)).fetchall()
+    """, (user_id,)).fetchall()
 
     # Format conversations with proper other party name
     formatted_conversations = []
@@ -61,9 +72,50 @@ def api_conversations():
         })
 
     cursor.close()
-    db.close()
 
-    return jsonify({"conversations": formatted_conversations})
+    return revalidate(jsonify({"conversations": formatted_conversations}), etag)
+
+def mark_read(db, conversation_id, user_id, message_id):
+    """Advance the user's read cursor to ``message_id``
+
+    Read state is one row per participant, so this is a single-row upsert,
+    and it is skipped (no write transaction at all) when the cursor is
+    already there. The unread count is re-derived from the new cursor.
+    """
+    row = db.execute("""
+        SELECT last_read_message_id FROM conversation_summaries
+        WHERE conversation_id = ? AND user_id = ?
+    """, (conversation_id, user_id)).fetchone()
+    if row is not None and row["last_read_message_id"] >= message_id:
+        return
+    db.execute("""
+        INSERT INTO conversation_summaries (conversation_id, user_id, last_read_message_id, unread_count)
+        VALUES (:conversation_id, :user_id, :message_id, 0)
+        ON CONFLICT (conversation_id, user_id) DO UPDATE SET
+            last_read_message_id = excluded.last_read_message_id,
+            unread_count = (
+                SELECT COUNT(*) FROM chat_messages
+                WHERE conversation_id = :conversation_id
+                AND id > :message_id AND sender_id != :user_id
+            )
+        WHERE excluded.last_read_message_id > conversation_summaries.last_read_message_id
+    """, {"conversation_id": conversation_id, "user_id": user_id, "message_id": message_id})
+    db.commit()
+
+def latest_message_id(cursor, conversation_id):
+    return cursor.execute("SELECT COALESCE(MAX(id), 0) FROM chat_messages WHERE conversation_id = ?",
+                          (conversation_id,)).fetchone()[0]
+
+def messages_after(cursor, conversation_id, since_id):
+    """Up to a page (plus one) of messages newer than ``since_id``, oldest first"""
+    return cursor.execute("""
+        SELECT chat_messages.*, users.username
+        FROM chat_messages
+        JOIN users ON chat_messages.sender_id = users.id
+        WHERE conversation_id = ? AND chat_messages.id > ?
+        ORDER BY chat_messages.id ASC
+        LIMIT ?
+    """, (conversation_id, since_id, MESSAGE_PAGE_SIZE + 1)).fetchall()
 
 @chat_bp.route("/api/conversation/<int:conversation_id>/messages")
 def api_conversation_messages(conversation_id):
@@ -72,7 +124,7 @@ def api_conversation_messages(conversation_id):
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     # Verify user is part of this conversation
@@ -83,25 +135,58 @@ def api_conversation_messages(conversation_id):
 
     if not conversation:
         cursor.close()
-        db.close()
         return jsonify({"error": "Conversation not found"}), 404
 
-    # Mark messages as read
-    cursor.execute("""
-        UPDATE chat_messages
-        SET is_read = 1
-        WHERE conversation_id = ? AND sender_id != ?
-    """, (conversation_id, user_id))
-    db.commit()
-
-    # Fetch messages
-    messages = cursor.execute("""
-        SELECT chat_messages.*, users.username
-        FROM chat_messages
-        JOIN users ON chat_messages.sender_id = users.id
-        WHERE conversation_id = ?
-        ORDER BY timestamp ASC
-    """, (conversation_id,)).fetchall()
+    # Keyset cursors: since_id (or after) polls for newer messages, before_id
+    # pages back through history; without either, return the latest page
+    since_id = request.args.get("since_id", type=int)
+    if since_id is None:
+        since_id = request.args.get("after", type=int)
+    before_id = request.args.get("before_id", type=int)
+    # Long-poll: with since_id, wait up to this many seconds for a new message
+    wait = min(max(request.args.get("wait", 0, type=float), 0), current_app.config["LONG_POLL_SECONDS"])
+
+    if since_id is not None and wait:
+        # Subscribe before reading so a message sent in between still wakes us
+        with subscribe(conversation_channel(conversation_id)) as subscription:
+            if latest_message_id(cursor, conversation_id) <= since_id:
+                # Don't hold a connection while parked
+                cursor.close()
+                close_db()
+                subscription.wait(wait)
+                db = get_db()
+                cursor = db.cursor()
+
+    # Messages are never edited, so the newest id pins down any page that
+    # reaches it, and a page of older history never changes
+    etag = make_etag(user_id, conversation_id, since_id, before_id,
+                     latest_message_id(cursor, conversation_id) if before_id is None else None)
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        cursor.close()
+        return unchanged
+
+    if since_id is not None:
+        messages = messages_after(cursor, conversation_id, since_id)
+    else:
+        older = "AND chat_messages.id < ?" if before_id is not None else ""
+        params = [conversation_id] + ([before_id] if before_id is not None else [])
+        # Newest first so LIMIT keeps the page next to the cursor, then back to oldest first
+        messages = cursor.execute(f"""
+            SELECT chat_messages.*, users.username
+            FROM chat_messages
+            JOIN users ON chat_messages.sender_id = users.id
+            WHERE conversation_id = ? {older}
+            ORDER BY chat_messages.id DESC
+            LIMIT ?
+        """, (*params, MESSAGE_PAGE_SIZE + 1)).fetchall()[::-1]
+    # One extra row tells us whether there is more to fetch in that direction
+    has_more = len(messages) > MESSAGE_PAGE_SIZE
+    messages = messages[:MESSAGE_PAGE_SIZE] if since_id is not None else messages[-MESSAGE_PAGE_SIZE:]
+
+    # Move the read cursor, unless this is only a page of older history
+    if before_id is None and messages:
+        mark_read(db, conversation_id, user_id, messages[-1]["id"])
 
     formatted_messages = [{
         "id": msg["id"],
@@ -112,9 +197,8 @@ def api_conversation_messages(conversation_id):
     } for msg in messages]
 
     cursor.close()
-    db.close()
 
-    return jsonify({"messages": formatted_messages, "user_id": user_id})
+    return revalidate(jsonify({"messages": formatted_messages, "user_id": user_id, "has_more": has_more}), etag)
 
 @chat_bp.route("/api/conversation/<int:conversation_id>/send", methods=["POST"])
 def api_send_message(conversation_id):
@@ -127,7 +211,7 @@ def api_send_message(conversation_id):
     if not message:
         return jsonify({"error": "Message cannot be empty"}), 400
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     # Verify user is part of this conversation
@@ -138,27 +222,16 @@ def api_send_message(conversation_id):
 
     if not conversation:
         cursor.close()
-        db.close()
         return jsonify({"error": "Conversation not found"}), 404
 
-    # Insert message
-    cursor.execute("""
-        INSERT INTO chat_messages (conversation_id, sender_id, message)
-        VALUES (?, ?, ?)
-    """, (conversation_id, user_id, message))
+    cursor.close()
 
     # Determine recipient for notification
     recipient_id = conversation["seller_id"] if user_id == conversation["buyer_id"] else conversation["buyer_id"]
 
-    # Insert notification
-    cursor.execute("""
-        INSERT INTO notifications (user_id, message)
-        VALUES (?, ?)
-    """, (recipient_id, f"New message from {session['username']}"))
-
-    db.commit()
-    cursor.close()
-    db.close()
+    # Insert message and notification; returns once committed
+    send_message(db, conversation_id, user_id, recipient_id, message,
+                 f"New message from {session['username']}")
 
     return jsonify({"success": True})
 
@@ -169,10 +242,10 @@ def inbox():
     if not user_id:
         return redirect("/login")
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
-    # Get conversations where user is either buyer or seller
+    # Get conversations where user is either buyer or seller, newest first
     conversations = cursor.execute("""
         SELECT 
             c.id AS conversation_id,
@@ -182,27 +255,17 @@ def inbox():
             seller.username AS seller_username,
             s.title AS service_title,
             m.message AS last_message,
-            m.timestamp AS last_timestamp,
-            (
-                SELECT COUNT(*) 
-                FROM chat_messages 
-                WHERE conversation_id = c.id
-                AND sender_id != ?
-                AND is_read = 0
-            ) AS unread_count
-        FROM conversations c
+            cs.last_timestamp,
+            cs.unread_count
+        FROM conversation_summaries cs
+        JOIN conversations c ON c.id = cs.conversation_id
         JOIN users buyer ON c.buyer_id = buyer.id
         JOIN users seller ON c.seller_id = seller.id
         JOIN services s ON c.service_id = s.id
-        LEFT JOIN chat_messages m ON m.id = (
-            SELECT id FROM chat_messages
-            WHERE conversation_id = c.id
-            ORDER BY timestamp DESC
-            LIMIT 1
-        )
-        WHERE c.buyer_id = ? OR c.seller_id = ?
-        ORDER BY last_timestamp DESC
-    """, (user_id, user_id, user_id)).fetchall()
+        LEFT JOIN chat_messages m ON m.id = cs.last_message_id
+        WHERE cs.user_id = ?
+        ORDER BY cs.last_timestamp DESC
+    """, (user_id,)).fetchall()
 
     # Format conversations with proper other party name
     formatted_conversations = []
@@ -222,12 +285,10 @@ def inbox():
         session["username"],
         session["profile_type"],
         None,
-        session["user_id"],
-        resume=session.get("resume", "")
+        session["user_id"]
     )
     
     cursor.close()
-    db.close()
 
     return render_template(
         "inbox.html",
@@ -242,7 +303,7 @@ def chat(service_id):
     if user_id is None:
         return redirect("/login")
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     # Get the service and seller
@@ -286,10 +347,9 @@ def chat(service_id):
         FROM chat_messages
         JOIN users ON chat_messages.sender_id = users.id
         WHERE conversation_id = ?
-        ORDER BY timestamp ASC
+        ORDER BY chat_messages.id ASC
     """, (conversation_id,)).fetchall()
     cursor.close()
-    db.close()
 
     service_data = {
         "id": service["id"], 
@@ -300,7 +360,7 @@ def chat(service_id):
         "image_url": service["image_url"] or "/static/default_image.png"
     }
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
+                          session["user_id"])
     
     return render_template("chat.html", 
                            service=service_data, 
@@ -314,7 +374,7 @@ def chat_conversation(conversation_id):
     if user_id is None:
         return redirect("/login")
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     # Check conversation exists
@@ -325,15 +385,6 @@ def chat_conversation(conversation_id):
     if not conversation:
         return "Conversation not found", 404
 
-    # Mark messages as read for this user
-    cursor.execute("""
-        UPDATE chat_messages
-        SET is_read = 1
-        WHERE conversation_id = ?
-        AND sender_id != ?
-    """, (conversation_id, user_id))
-    db.commit()
-
     # Load service
     service = cursor.execute("""
         SELECT services.*, users.username AS seller_name
@@ -348,9 +399,13 @@ def chat_conversation(conversation_id):
         FROM chat_messages
         JOIN users ON chat_messages.sender_id = users.id
         WHERE conversation_id = ?
-        ORDER BY timestamp ASC
+        ORDER BY chat_messages.id ASC
     """, (conversation_id,)).fetchall()
 
+    # Mark messages as read for this user
+    if messages:
+        mark_read(db, conversation_id, user_id, messages[-1]["id"])
+
     service_data = {
         "id": service["id"],
         "title": service["title"],
@@ -364,11 +419,9 @@ def chat_conversation(conversation_id):
         session["username"],
         session["profile_type"],
         None,
-        session["user_id"],
-        resume=session.get("resume", "")
+        session["user_id"]
     )
     cursor.close()
-    db.close()
 
     return render_template("chat.html",
                            service=service_data,
@@ -387,7 +440,7 @@ def send_msg(conversation_id):
     if msg == "":
         return redirect(f"/chat/{conversation_id}")
 
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     conv = cursor.execute("""
@@ -398,24 +451,13 @@ def send_msg(conversation_id):
     if conv is None:
         return "Unauthorized", 403
 
-    cursor.execute("""
-        INSERT INTO chat_messages (conversation_id, sender_id, message)
-        VALUES (?, ?, ?)
-    """, (conversation_id, user_id, msg))
-
     # Determine who to notify
     recipient_id = conv["seller_id"] if user_id == conv["buyer_id"] else conv["buyer_id"]
 
-    # Insert notification
-    cursor.execute("""
-        INSERT INTO notifications (user_id, message)
-        VALUES (?, ?)
-    """, (recipient_id, f"New message from {session['username']}"))
-
-    db.commit()
+    send_message(db, conversation_id, user_id, recipient_id, msg,
+                 f"New message from {session['username']}")
 
     service_id = conv["service_id"]
     cursor.close()
-    db.close()
 
     return redirect(f"/chat/{service_id}")
@@ -1,42 +1,48 @@
 """Resume upload and management routes"""
-from flask import Blueprint, render_template, request, session, flash, url_for, redirect
+from flask import Blueprint, render_template, request, session, flash, url_for, redirect, jsonify
 from werkzeug.utils import secure_filename
-import PyPDF2
-import os
 from src.models import Profile
-from src.utils.database import get_db_connection
+from src.utils.database import get_db
+from src.utils.embedding_jobs import enqueue_user
+from src.utils.uploads import SNIFF_BYTES, store_upload, text_encoding, upload_limit
+from src.utils.resume_jobs import queue_resume, resume_status
+from src.config import RESUME_MAX_CHARS, RESUME_FILE_MAX_BYTES
 
 resume_bp = Blueprint('resume', __name__)
 
 ALLOWED_EXTENSIONS = {"pdf", "txt"}
-UPLOAD_FOLDER = "static/uploads"
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @resume_bp.route("/upload_resume", methods=["GET", "POST"])
+@upload_limit(RESUME_FILE_MAX_BYTES, ALLOWED_EXTENSIONS)
 def upload_resume():
     if request.method == "POST":
         resume_text = request.form.get("resume_text", "").strip()
         resume_file = request.files.get("resume_file")
 
         extracted_text = ""
+        resume_url = None
+        status = None
+        db = get_db()
 
         if resume_file:
             filename = secure_filename(resume_file.filename)
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            resume_file.save(filepath)
-
             ext = filename.rsplit(".", 1)[1].lower()
+            # Stored by content hash, so re-uploading the same file doesn't copy it again
+            filepath = store_upload(db, resume_file, f".{ext}")
+            resume_url = f"/{filepath}"
+
             if ext == "pdf":
-                with open(filepath, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    for page in reader.pages:
-                        extracted_text += page.extract_text() or ""
+                # Parsed in the background; the current resume text stays until it's done
+                status = "pending"
 
             elif ext == "txt":
-                with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                    extracted_text = f.read()
+                with open(filepath, "rb") as f:
+                    encoding = text_encoding(f.read(SNIFF_BYTES)) or "utf-8"
+                with open(filepath, "r", encoding=encoding, errors="ignore") as f:
+                    extracted_text = f.read(RESUME_MAX_CHARS)
 
         elif resume_text:
             extracted_text = resume_text
@@ -45,43 +51,51 @@ def upload_resume():
             flash("Please upload a file or paste your resume text.", "warning")
             return redirect(url_for("resume.upload_resume"))
         
-        db = get_db_connection()
         cursor = db.cursor()
-        cursor.execute("UPDATE users SET resume = ? WHERE id = ?", 
-                      (extracted_text, session["user_id"]))
-        db.commit()
+        # Replacing resume_url releases the previous file for collection
+        if status == "pending":
+            cursor.execute("UPDATE users SET resume_url = ? WHERE id = ?", (resume_url, session["user_id"]))
+            db.commit()
+            queue_resume(db, session["user_id"], filepath, resume_url)
+            extracted_text = cursor.execute("SELECT resume FROM users WHERE id = ?",
+                                            (session["user_id"],)).fetchone()["resume"]
+        else:
+            cursor.execute("UPDATE users SET resume = ?, resume_url = ? WHERE id = ?", 
+                          (extracted_text, resume_url, session["user_id"]))
+            # Any extraction still running is for a resume that's been replaced
+            cursor.execute("DELETE FROM resume_jobs WHERE user_id = ?", (session["user_id"],))
+            db.commit()
+            # The resume embedding feeds into every one of this seller's service scores
+            enqueue_user(db, session["user_id"])
 
-        session["resume"] = extracted_text
         user_profile = Profile(
             username=session["username"],
             profile_type=session["profile_type"],
             password=None,
             id=session["user_id"],
-            resume=session["resume"]
+            resume=extracted_text
         )
 
         total_unread = cursor.execute("""
-            SELECT COUNT(*)
-            FROM chat_messages
-            JOIN conversations ON chat_messages.conversation_id = conversations.id
-            WHERE conversations.seller_id = ?
-            AND chat_messages.sender_id != ?
-            AND chat_messages.is_read = 0
-        """, (session["user_id"], session["user_id"])).fetchone()[0]
+            SELECT COALESCE(SUM(conversation_summaries.unread_count), 0)
+            FROM conversation_summaries
+            JOIN conversations ON conversation_summaries.conversation_id = conversations.id
+            WHERE conversation_summaries.user_id = ?
+            AND conversations.seller_id = conversation_summaries.user_id
+        """, (session["user_id"],)).fetchone()[0]
         
         cursor.close()
-        db.close()
 
-        return render_template("mainpage_seller.html", profile=user_profile, total_unread=total_unread)
+        return render_template("mainpage_seller.html", profile=user_profile, total_unread=total_unread,
+                               resume_status=status)
 
     else:
-        db = get_db_connection()
+        db = get_db()
         cursor = db.cursor()
         cursor.execute("SELECT resume FROM users WHERE id = ?", (session["user_id"],))
         row = cursor.fetchone()
         resume_value = row["resume"] if row and row["resume"] else ""
         cursor.close()
-        db.close()
 
         user_profile = Profile(
             session["username"],
@@ -92,3 +106,13 @@ def upload_resume():
         )
 
         return render_template("upload_resume.html", profile=user_profile)
+
+@resume_bp.route("/api/resume/status")
+def api_resume_status():
+    """Progress of the latest resume upload, for polling while it's pending"""
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    status, error = resume_status(get_db(), user_id)
+    return jsonify({"status": status, "error": error})
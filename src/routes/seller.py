@@ -1,16 +1,23 @@
 """Seller-related routes"""
 from flask import Blueprint, render_template, request, session, redirect
 from src.models import Profile, freelance_post
-from src.utils.database import get_db_connection
-from src.config import SERVICE_TAGS
+from src.utils.database import get_db
+from src.utils.embeddings import delete_service_embedding
+from src.utils.embedding_jobs import enqueue_service, forget_service
+from src.utils.images import queue_service_image
+from src.utils.uploads import store_upload, upload_limit
+from src.utils.resume_jobs import resume_status
+from src.config import SERVICE_TAGS, SERVICE_IMAGE_MAX_BYTES
 import os
 from werkzeug.utils import secure_filename
 
 seller_bp = Blueprint('seller', __name__)
 
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+
 @seller_bp.route("/seller", methods=["GET", "POST"])
 def seller():
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     # Fetch current user's resume
@@ -18,13 +25,12 @@ def seller():
 
     # Fetch unread message count for this seller
     total_unread = cursor.execute("""
-        SELECT COUNT(*)
-        FROM chat_messages
-        JOIN conversations ON chat_messages.conversation_id = conversations.id
-        WHERE conversations.seller_id = ?
-        AND chat_messages.sender_id != ?
-        AND chat_messages.is_read = 0
-    """, (session["user_id"], session["user_id"])).fetchone()[0]
+        SELECT COALESCE(SUM(conversation_summaries.unread_count), 0)
+        FROM conversation_summaries
+        JOIN conversations ON conversation_summaries.conversation_id = conversations.id
+        WHERE conversation_summaries.user_id = ?
+        AND conversations.seller_id = conversation_summaries.user_id
+    """, (session["user_id"],)).fetchone()[0]
 
     # Fetch the seller's services + include resume via JOIN
     user_tasks = cursor.execute("""
@@ -48,7 +54,10 @@ def seller():
         for row in user_tasks
     ]
 
-    session["profile_type"] = "seller"
+    # Assigning marks the session modified, which costs a session write
+    if session.get("profile_type") != "seller":
+        session["profile_type"] = "seller"
+    status, _ = resume_status(db, session["user_id"])
     user_profile = Profile(
         username=session["username"],
         profile_type=session["profile_type"],
@@ -58,7 +67,6 @@ def seller():
     )
     
     cursor.close()
-    db.close()
 
     return render_template(
         "mainpage_seller.html",
@@ -66,9 +74,11 @@ def seller():
         profile=user_profile,
         tags=SERVICE_TAGS,
         total_unread=total_unread,
+        resume_status=status,
     )
 
 @seller_bp.route("/add_service", methods=["GET", "POST"])
+@upload_limit(SERVICE_IMAGE_MAX_BYTES, IMAGE_EXTENSIONS)
 def add_service():
     if request.method == "POST":
         title = request.form.get("title")
@@ -76,38 +86,30 @@ def add_service():
         price = request.form.get("price")
         tag = request.form.get("tag", "Other")  # Default to "Other" if not provided
         
+        db = get_db()
+        cursor = db.cursor()
+
         # Handle image upload
         image_url = None
         if 'service_image' in request.files:
             file = request.files['service_image']
             if file and file.filename:
-                # Create uploads directory if it doesn't exist
-                upload_folder = 'static/uploads'
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Generate unique filename
-                filename = secure_filename(file.filename)
-                timestamp = str(int(__import__('time').time()))
-                unique_filename = f"{timestamp}_{filename}"
-                filepath = os.path.join(upload_folder, unique_filename)
-                
-                # Save file
-                file.save(filepath)
+                # Stored by content hash, so identical images share one file
+                ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+                filepath = store_upload(db, file, ext)
                 image_url = f"/{filepath}"
-        
-        db = get_db_connection()
-        cursor = db.cursor()
 
         cursor.execute("INSERT INTO services (title, description, price, user_id, tag, image_url) VALUES (?, ?, ?, ?, ?, ?)", 
                       (title, description, price, session["user_id"], tag, image_url))
         db.commit()
+        service_id = cursor.lastrowid
+        enqueue_service(db, service_id)
+        if image_url:
+            # Thumbnail and WebP are built off the request thread
+            queue_service_image(service_id, filepath)
         cursor.close()
-        db.close()
-
-        return redirect("/seller")
-        db.close()
 
-        return render_template("mainpage_seller.html", services=user_posts, profile=user_profile, tags=SERVICE_TAGS)
+    return redirect("/seller")
 
 @seller_bp.route("/edit_service", methods=["GET", "POST"])
 def edit_service():
@@ -116,12 +118,14 @@ def edit_service():
     description = request.form.get("description")
     price = request.form.get("price")
     
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     cursor.execute("UPDATE services SET title = ?, description = ?, price = ? WHERE user_id = ? AND id = ?", 
                   (title, description, price, session["user_id"], service_id))
     db.commit()
+    if cursor.rowcount:
+        enqueue_service(db, int(service_id))
 
     user_tasks = cursor.execute("""SELECT services.id, services.title, services.description, services.price, 
                                   services.image_url, users.resume, users.username FROM services
@@ -130,10 +134,10 @@ def edit_service():
     user_posts = [freelance_post(row["title"], row["description"], row["price"], row["id"], 
                                 row["resume"], row["username"], row["image_url"]) for row in user_tasks]
 
+    resume = cursor.execute("SELECT resume FROM users WHERE id = ?", (session["user_id"],)).fetchone()["resume"]
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
+                          session["user_id"], resume=resume)
     cursor.close()
-    db.close()
 
     return render_template("mainpage_seller.html", services=user_posts, profile=user_profile, tags=SERVICE_TAGS)
 
@@ -141,11 +145,14 @@ def edit_service():
 def delete_service():
     service_id = request.form.get("service_id")
     
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     cursor.execute("DELETE FROM services WHERE id = ? AND user_id = ?", (service_id, session["user_id"]))
     db.commit()
+    if cursor.rowcount:
+        delete_service_embedding(db, service_id)
+        forget_service(db, service_id)
 
     user_tasks = cursor.execute("""SELECT services.id, services.title, services.description, services.price, 
                                   services.image_url, users.resume, users.username FROM services
@@ -154,16 +161,16 @@ def delete_service():
     user_posts = [freelance_post(row["title"], row["description"], row["price"], row["id"], 
                                 row["resume"], row["username"], row["image_url"]) for row in user_tasks]
 
+    resume = cursor.execute("SELECT resume FROM users WHERE id = ?", (session["user_id"],)).fetchone()["resume"]
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
+                          session["user_id"], resume=resume)
     cursor.close()
-    db.close()
     
     return render_template("mainpage_seller.html", services=user_posts, profile=user_profile, tags=SERVICE_TAGS)
 
 @seller_bp.route("/seller/inbox")
 def seller_inbox():
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
 
     seller_id = session.get("user_id")
@@ -176,26 +183,16 @@ def seller_inbox():
             u.username AS buyer_username,
             s.title AS service_title,
             m.message AS last_message,
-            m.timestamp AS last_timestamp,
-            (
-                SELECT COUNT(*) 
-                FROM chat_messages 
-                WHERE conversation_id = c.id
-                AND sender_id != ?
-                AND is_read = 0
-            ) AS unread_count
-        FROM conversations c
+            cs.last_timestamp,
+            cs.unread_count
+        FROM conversation_summaries cs
+        JOIN conversations c ON c.id = cs.conversation_id
         JOIN users u ON c.buyer_id = u.id
         JOIN services s ON c.service_id = s.id
-        LEFT JOIN chat_messages m ON m.id = (
-            SELECT id FROM chat_messages
-            WHERE conversation_id = c.id
-            ORDER BY timestamp DESC
-            LIMIT 1
-        )
-        WHERE c.seller_id = ?
-        ORDER BY last_timestamp DESC
-    """, (seller_id, seller_id)).fetchall()
+        LEFT JOIN chat_messages m ON m.id = cs.last_message_id
+        WHERE cs.user_id = ? AND c.seller_id = cs.user_id
+        ORDER BY cs.last_timestamp DESC
+    """, (seller_id,)).fetchall()
 
     total_unread = sum(c["unread_count"] for c in conversations)
 
@@ -203,12 +200,10 @@ def seller_inbox():
         session["username"],
         session["profile_type"],
         None,
-        session["user_id"],
-        resume=session.get("resume", "")
+        session["user_id"]
     )
     
     cursor.close()
-    db.close()
 
     return render_template(
         "seller_inbox.html",
@@ -4,7 +4,7 @@ import os
 import stripe
 from dotenv import load_dotenv
 from src.models import Profile
-from src.utils.database import get_db_connection
+from src.utils.database import get_db
 
 # Load environment variables
 load_dotenv()
@@ -16,11 +16,10 @@ stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 
 @service_bp.route("/service/<int:service_id>")
 def service_detail(service_id):
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
     service = cursor.execute("SELECT * FROM services WHERE id = ?", (service_id,)).fetchone()
     cursor.close()
-    db.close()
     
     if not service:
         return "Service not found", 404
@@ -30,20 +29,20 @@ def service_detail(service_id):
         "title": service["title"], 
         "description": service["description"], 
         "price": service["price"],
-        "image_url": service["image_url"] if service["image_url"] else "/static/default_image.png"
+        "image_url": service["image_url"] if service["image_url"] else "/static/default_image.png",
+        "image_webp_url": service["image_webp_url"]
     }
     user_profile = Profile(session["username"], session["profile_type"], None, 
-                          session["user_id"], resume=session.get("resume", ""))
+                          session["user_id"])
     
     return render_template("service_detail.html", service=service_data, profile=user_profile)
 
 @service_bp.route('/create-checkout-session/<int:service_id>', methods=['POST'])
 def create_checkout_session(service_id):
-    db = get_db_connection()
+    db = get_db()
     cursor = db.cursor()
     service = cursor.execute("SELECT * FROM services WHERE id = ?", (service_id,)).fetchone()
     cursor.close()
-    db.close()
     
     if not service:
         return "Service not found", 404
@@ -0,0 +1,165 @@
+"""Approximate nearest-neighbour index over service embeddings
+
+An inverted-file (IVF) index: vectors are clustered around ``nlist`` centroids
+and a query only scores the members of its ``nprobe`` closest clusters, so
+query cost grows with ``N * nprobe / nlist`` instead of ``N``. Raising
+``nprobe`` trades speed for recall; ``exact=True`` scans everything and is
+the reference the approximate results can be checked against. An index
+created with ``clustered=False`` never clusters and always searches exactly.
+"""
+import threading
+import numpy as np
+
+# Below this many vectors a brute-force scan is cheaper than clustering
+MIN_TRAIN_SIZE = 1024
+KMEANS_ITERATIONS = 10
+
+def top_k(ids, scores, k):
+    """Best ``k`` (id, score) pairs using partial selection instead of a full sort
+
+    Equal scores keep their order in ``ids``, so the first ``k`` results are
+    the same whatever ``k`` is and consecutive pages never overlap.
+    """
+    if k is None or k >= len(scores):
+        order = np.argsort(-scores, kind="stable")
+    else:
+        # Everything scoring at least the k-th best, including all of its ties
+        kth = np.partition(-scores, k - 1)[k - 1]
+        part = np.flatnonzero(-scores <= kth)
+        order = part[np.argsort(-scores[part], kind="stable")][:k]
+    return [(ids[i], float(scores[i])) for i in order]
+
+class VectorIndex:
+    """IVF index with incremental insert and delete"""
+
+    def __init__(self, dim, nprobe=8, clustered=True):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.clustered = clustered
+        self.centroids = None
+        self.lists = []         # per cluster: list of ids
+        self.list_vectors = []  # per cluster: (n, dim) float32 matrix
+        self.location = {}      # id -> cluster number
+        self.vectors = {}       # id -> vector, kept for exact search and retraining
+        self.trained_size = 0
+        # Every vector stacked in id order for exact search; rebuilt after a change
+        self.matrix = None
+        self.matrix_ids = []
+        self.rows = {}          # id -> row of self.matrix
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def train(self):
+        """(Re)cluster all vectors with spherical k-means"""
+        with self.lock:
+            ids = list(self.vectors)
+            if not self.clustered or len(ids) < MIN_TRAIN_SIZE:
+                self.centroids = None
+                self.lists, self.list_vectors, self.location = [], [], {}
+                self.trained_size = len(ids)
+                return
+
+            matrix = np.vstack([self.vectors[i] for i in ids])
+            nlist = int(np.sqrt(len(ids)))
+            rng = np.random.default_rng(0)
+            centroids = matrix[rng.choice(len(ids), nlist, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                assignment = np.argmax(matrix @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = matrix[assignment == c]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            self.centroids = centroids
+            self.lists = [[] for _ in range(nlist)]
+            self.list_vectors = [np.empty((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+            self.location = {}
+            for c in range(nlist):
+                rows = np.flatnonzero(assignment == c)
+                self.lists[c] = [ids[r] for r in rows]
+                self.list_vectors[c] = matrix[rows]
+                for r in rows:
+                    self.location[ids[r]] = c
+            self.trained_size = len(ids)
+
+    def add(self, item_id, vector):
+        """Insert or replace one vector"""
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            self.remove(item_id)
+            self.vectors[item_id] = vector
+            self.matrix = None
+            if not self.clustered:
+                return
+            if self.centroids is None:
+                if len(self.vectors) >= max(MIN_TRAIN_SIZE, 2 * self.trained_size):
+                    self.train()
+                return
+            # Clusters drift as the catalogue grows; recluster once it has doubled
+            if len(self.vectors) >= 2 * self.trained_size:
+                self.train()
+                return
+            c = int(np.argmax(self.centroids @ vector))
+            self.lists[c].append(item_id)
+            self.list_vectors[c] = np.vstack([self.list_vectors[c], vector])
+            self.location[item_id] = c
+
+    def remove(self, item_id):
+        with self.lock:
+            if self.vectors.pop(item_id, None) is None:
+                return
+            self.matrix = None
+            c = self.location.pop(item_id, None)
+            if c is not None:
+                row = self.lists[c].index(item_id)
+                del self.lists[c][row]
+                self.list_vectors[c] = np.delete(self.list_vectors[c], row, axis=0)
+
+    def exact_matrix(self):
+        """``(ids, rows, matrix)`` with every vector, stacked once per change"""
+        with self.lock:
+            if self.matrix is None:
+                self.matrix_ids = sorted(self.vectors)
+                self.rows = {item_id: row for row, item_id in enumerate(self.matrix_ids)}
+                self.matrix = (np.vstack([self.vectors[i] for i in self.matrix_ids]) if self.matrix_ids
+                               else np.empty((0, self.dim), dtype=np.float32))
+            return self.matrix_ids, self.rows, self.matrix
+
+    def search(self, query, k, nprobe=None, exact=False, ids=None):
+        """Return up to ``k`` (id, score) pairs ordered by cosine similarity
+
+        ``ids`` restricts the search to those items and is always exact.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        with self.lock:
+            if ids is not None:
+                _, rows, matrix = self.exact_matrix()
+                ids = [i for i in ids if i in rows]
+                if not ids:
+                    return []
+                matrix = matrix[[rows[i] for i in ids]]
+            elif exact or self.centroids is None:
+                ids, _, matrix = self.exact_matrix()
+                if not ids:
+                    return []
+            else:
+                nprobe = min(nprobe or self.nprobe, len(self.centroids))
+                probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                ids = [i for c in probes for i in self.lists[c]]
+                if not ids:
+                    return []
+                matrix = np.vstack([self.list_vectors[c] for c in probes])
+        return top_k(ids, matrix @ query, k)
+
+    def recall(self, queries, k, nprobe=None):
+        """Average fraction of the exact top-k that the approximate search returns"""
+        hits = 0
+        for query in queries:
+            expected = {i for i, _ in self.search(query, k, exact=True)}
+            found = {i for i, _ in self.search(query, k, nprobe=nprobe)}
+            hits += len(expected & found) / max(len(expected), 1)
+        return hits / max(len(queries), 1)
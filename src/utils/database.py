@@ -1,8 +1,51 @@
 """Database utilities"""
 import sqlite3
+import threading
+from flask import g
+from src.config import SQLITE_PRAGMA_PROFILES, SQLITE_PRAGMA_PROFILE, SQLITE_REUSE_CONNECTIONS
+from src.utils.migrations import migrate
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect("project.db")
+DATABASE = "project.db"
+
+def get_db_connection(profile=None):
+    """Open a new connection with the pragmas of ``profile`` applied
+
+    Use this outside a request (background threads, scripts); request
+    handlers should call ``get_db()``.
+    """
+    conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
+    for pragma, value in SQLITE_PRAGMA_PROFILES[profile or SQLITE_PRAGMA_PROFILE].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
     return conn
+
+# Connections kept per thread when SQLITE_REUSE_CONNECTIONS is on
+_local = threading.local()
+
+def get_db():
+    """The connection for the current request, opened on first use and closed in teardown"""
+    if "db" not in g:
+        if SQLITE_REUSE_CONNECTIONS:
+            if getattr(_local, "conn", None) is None:
+                _local.conn = get_db_connection()
+            g.db = _local.conn
+        else:
+            g.db = get_db_connection()
+    return g.db
+
+def close_db(exception=None):
+    """Teardown handler: release the request's connection"""
+    db = g.pop("db", None)
+    if db is None:
+        return
+    if SQLITE_REUSE_CONNECTIONS:
+        # The thread keeps the connection, so don't hand an open transaction to its next request
+        db.rollback()
+    else:
+        db.close()
+
+def init_db():
+    """Apply pending schema migrations"""
+    conn = get_db_connection()
+    migrate(conn)
+    conn.close()
@@ -0,0 +1,253 @@
+"""Background embedding jobs
+
+Seller requests only enqueue work in ``embedding_jobs``; an ``EmbeddingWorker``
+thread claims pending jobs in batches and encodes them in a single model call.
+Jobs live in SQLite, so anything queued before a restart is picked up again.
+
+``service_index_status`` records whether each service's stored embedding is
+``fresh``, ``pending`` (a job is queued, any stored vector is out of date) or
+``failed``. Jobs that fail ``MAX_ATTEMPTS`` times in a row are queued again
+once they have been failed for ``RETRY_FAILED_AFTER_SECONDS``.
+
+The same queue builds new recommendation feeds (``feed`` jobs), so scoring
+the catalogue never happens on a request thread either.
+"""
+import logging
+import threading
+from src.config import EMBEDDING_BATCH_SIZE, EMBEDDING_POLL_SECONDS
+from src.utils.database import get_db_connection
+from src.utils.embeddings import refresh_embeddings, prune_changes
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# A running job untouched for this long belongs to a worker that is gone
+ABANDONED_AFTER_SECONDS = 600
+# A job that used up its attempts gets another round after this long
+RETRY_FAILED_AFTER_SECONDS = 60 * 60
+
+# True when a pending job will (re)embed service_index_status.service_id
+PENDING_JOB = """EXISTS (
+    SELECT 1 FROM embedding_jobs
+    WHERE embedding_jobs.status = 'pending'
+    AND (
+        (kind = 'service' AND target_id = service_index_status.service_id)
+        OR (kind = 'user' AND target_id = (
+            SELECT user_id FROM services WHERE id = service_index_status.service_id
+        ))
+    )
+)"""
+
+# Set by enqueue so an in-process worker starts without waiting for its poll
+_wakeup = threading.Event()
+
+def _enqueue(conn, jobs, service_ids):
+    """Queue ``(kind, target_id)`` jobs and mark the services they affect pending"""
+    conn.executemany("""
+        INSERT OR IGNORE INTO embedding_jobs (kind, target_id) VALUES (?, ?)
+    """, jobs)
+    conn.executemany("""
+        INSERT OR REPLACE INTO service_index_status (service_id, status, updated_at)
+        VALUES (?, 'pending', CURRENT_TIMESTAMP)
+    """, [(service_id,) for service_id in service_ids])
+    conn.commit()
+    _wakeup.set()
+
+def enqueue_service(conn, service_id):
+    """Queue a service whose title or description changed"""
+    _enqueue(conn, [("service", service_id)], [service_id])
+
+def enqueue_user(conn, user_id):
+    """Queue a seller whose resume changed; all their services are affected"""
+    rows = conn.execute("SELECT id FROM services WHERE user_id = ?", (user_id,)).fetchall()
+    _enqueue(conn, [("user", user_id)], [row[0] for row in rows])
+
+def enqueue_feed(conn, feed_id):
+    """Queue building the recommendation feed with rowid ``feed_id``"""
+    _enqueue(conn, [("feed", feed_id)], [])
+
+def enqueue_missing(conn):
+    """Queue services and seller resumes that have never been embedded; returns how many
+
+    Anything already queued or failed is left alone; ``retry_failed`` covers failures.
+    """
+    services = [row[0] for row in conn.execute("""
+        SELECT services.id FROM services
+        LEFT JOIN service_embeddings ON service_embeddings.service_id = services.id
+        LEFT JOIN service_index_status ON service_index_status.service_id = services.id
+        WHERE service_embeddings.service_id IS NULL AND service_index_status.service_id IS NULL
+    """)]
+    users = [row[0] for row in conn.execute("""
+        SELECT DISTINCT users.id FROM users
+        JOIN services ON services.user_id = users.id
+        LEFT JOIN resume_embeddings ON resume_embeddings.user_id = users.id
+        WHERE resume_embeddings.user_id IS NULL AND TRIM(COALESCE(users.resume, '')) != ''
+        AND NOT EXISTS (SELECT 1 FROM embedding_jobs WHERE kind = 'user' AND target_id = users.id)
+    """)]
+    if services or users:
+        _enqueue(conn, [("service", i) for i in services] + [("user", i) for i in users], services)
+    return len(services) + len(users)
+
+def forget_service(conn, service_id):
+    conn.execute("DELETE FROM embedding_jobs WHERE kind = 'service' AND target_id = ?", (service_id,))
+    conn.execute("DELETE FROM service_index_status WHERE service_id = ?", (service_id,))
+    conn.commit()
+
+def index_status(conn, service_ids):
+    """Return ``{service_id: status}`` for services that have one"""
+    service_ids = list(service_ids)
+    statuses = {}
+    for start in range(0, len(service_ids), 500):
+        chunk = service_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"""
+            SELECT service_id, status FROM service_index_status
+            WHERE service_id IN ({placeholders})
+        """, chunk).fetchall()
+        statuses.update((row[0], row[1]) for row in rows)
+    return statuses
+
+def claim_jobs(conn, limit):
+    """Atomically move up to ``limit`` pending jobs to running"""
+    conn.execute("BEGIN IMMEDIATE")
+    jobs = conn.execute("""
+        SELECT id, kind, target_id FROM embedding_jobs
+        WHERE status = 'pending'
+        ORDER BY id
+        LIMIT ?
+    """, (limit,)).fetchall()
+    conn.executemany("""
+        UPDATE embedding_jobs
+        SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, [(job[0],) for job in jobs])
+    conn.commit()
+    return jobs
+
+def run_pending(conn, limit=EMBEDDING_BATCH_SIZE):
+    """Process one batch of jobs with a single encode call; returns the number handled"""
+    jobs = claim_jobs(conn, limit)
+    if not jobs:
+        return 0
+
+    edited_ids = {job[2] for job in jobs if job[1] == "service"}
+    user_ids = [job[2] for job in jobs if job[1] == "user"]
+    feed_ids = [job[2] for job in jobs if job[1] == "feed"]
+    # Services whose blended vector changes with their seller's resume
+    service_ids = set(edited_ids)
+    if user_ids:
+        placeholders = ",".join("?" * len(user_ids))
+        rows = conn.execute(f"SELECT id FROM services WHERE user_id IN ({placeholders})",
+                            user_ids).fetchall()
+        service_ids.update(row[0] for row in rows)
+
+    job_ids = [(job[0],) for job in jobs]
+    try:
+        # Deleted services simply drop out of the refresh query
+        refresh_embeddings(conn, edited_ids, user_ids)
+        if feed_ids:
+            # Built after the refresh so they include this batch's vectors
+            from src.utils.recommendations import build_feeds
+            build_feeds(conn, feed_ids)
+    except Exception as e:
+        conn.rollback()
+        # OR IGNORE: a newer pending job for the same target supersedes the retry
+        conn.executemany(f"""
+            UPDATE OR IGNORE embedding_jobs
+            SET status = CASE WHEN attempts < {MAX_ATTEMPTS} THEN 'pending' ELSE 'failed' END,
+                error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(str(e), job_id) for (job_id,) in job_ids])
+        conn.executemany("DELETE FROM embedding_jobs WHERE id = ? AND status = 'running'", job_ids)
+        # Services whose job goes round again stay pending
+        conn.executemany(f"""
+            UPDATE service_index_status
+            SET status = CASE WHEN {PENDING_JOB} THEN 'pending' ELSE 'failed' END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE service_id = ?
+        """, [(service_id,) for service_id in service_ids])
+        conn.commit()
+        logger.exception("Embedding batch of %d job(s) failed", len(jobs))
+        return len(jobs)
+
+    conn.executemany("DELETE FROM embedding_jobs WHERE id = ?", job_ids)
+    # A job queued again while this batch ran keeps its service pending
+    conn.executemany(f"""
+        UPDATE service_index_status SET status = 'fresh', updated_at = CURRENT_TIMESTAMP
+        WHERE service_id = ? AND NOT {PENDING_JOB}
+    """, [(service_id,) for service_id in service_ids])
+    conn.commit()
+    return len(jobs)
+
+def requeue_abandoned(conn):
+    """Retry jobs left running by a process that died mid-batch"""
+    stale = f"status = 'running' AND updated_at < datetime('now', '-{ABANDONED_AFTER_SECONDS} seconds')"
+    conn.execute(f"UPDATE OR IGNORE embedding_jobs SET status = 'pending' WHERE {stale}")
+    conn.execute(f"DELETE FROM embedding_jobs WHERE {stale}")
+    conn.commit()
+
+def retry_failed(conn, after_seconds=RETRY_FAILED_AFTER_SECONDS):
+    """Queue jobs that failed for good at least ``after_seconds`` ago again; returns how many
+
+    Without this a feed whose build failed would never be built, and its
+    buyers would see the newest-services fallback for good.
+    """
+    stale = f"status = 'failed' AND updated_at < datetime('now', '-{int(after_seconds)} seconds')"
+    jobs = [(row[0], row[1]) for row in
+            conn.execute(f"SELECT kind, target_id FROM embedding_jobs WHERE {stale}").fetchall()]
+    if not jobs:
+        return 0
+    service_ids = [target_id for kind, target_id in jobs if kind == "service"]
+    for kind, target_id in jobs:
+        if kind == "user":
+            rows = conn.execute("SELECT id FROM services WHERE user_id = ?", (target_id,)).fetchall()
+            service_ids.extend(row[0] for row in rows)
+    conn.execute(f"DELETE FROM embedding_jobs WHERE {stale}")
+    # Fresh pending jobs, so each gets MAX_ATTEMPTS again
+    _enqueue(conn, jobs, service_ids)
+    logger.info("Retrying %d failed embedding job(s)", len(jobs))
+    return len(jobs)
+
+class EmbeddingWorker(threading.Thread):
+    """Daemon thread that drains ``embedding_jobs``"""
+
+    def __init__(self, batch_size=EMBEDDING_BATCH_SIZE, poll_seconds=EMBEDDING_POLL_SECONDS):
+        super().__init__(name="embedding-worker", daemon=True)
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = get_db_connection()
+        requeue_abandoned(conn)
+        while not self.stopping.is_set():
+            try:
+                handled = run_pending(conn, self.batch_size)
+            except Exception:
+                conn.rollback()
+                logger.exception("Embedding worker error")
+                handled = 0
+            if not handled:
+                try:
+                    prune_changes(conn)
+                    retry_failed(conn)
+                except Exception:
+                    conn.rollback()
+                    logger.exception("Embedding queue upkeep failed")
+                _wakeup.wait(self.poll_seconds)
+                _wakeup.clear()
+        conn.close()
+
+    def stop(self):
+        self.stopping.set()
+        _wakeup.set()
+
+_worker = None
+
+def start_worker():
+    """Start the process-wide embedding worker once"""
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = EmbeddingWorker()
+        _worker.start()
+    return _worker
@@ -0,0 +1,246 @@
+"""Sentence embeddings for services and seller resumes, persisted in SQLite
+
+Each service is encoded once when it is created or edited and each seller's
+resume once when it is uploaded; the vectors are stored as float32 BLOBs in
+``service_embeddings`` and ``resume_embeddings``. Searches then only need to
+encode the query and score it against the stored matrix.
+"""
+import hashlib
+import threading
+import numpy as np
+from src.config import (
+    ANN_NPROBE, SEARCH_BACKEND, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, RESUME_SCORE_WEIGHT
+)
+from src.utils.ann_index import VectorIndex
+from src.utils.cache import LRUCache
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+# Loaded on first use (or by warm_up) so importing the app does not pay for torch
+_model = None
+_model_lock = threading.Lock()
+
+# Buyers repeat the same category and preference queries constantly
+query_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# Process-wide vector index over service_embeddings, built on first use and
+# caught up from embedding_changes (up to _index_change_id) before each search
+_index = None
+_index_change_id = 0
+_index_lock = threading.Lock()
+# How long embedding_changes rows are kept; a process whose index is further
+# behind than this rebuilds it
+CHANGES_KEEP_SECONDS = 24 * 60 * 60
+
+def service_text(title, description):
+    """Text that represents a service in the embedding space
+
+    The seller's resume is embedded separately (``resume_embeddings``) so it
+    is encoded once per seller and can't crowd the title out of the model's
+    input window.
+    """
+    return f"TITLE: {title}. DESCRIPTION: {description}."
+
+def text_hash(text):
+    """Fingerprint used to detect embeddings that no longer match their text"""
+    return hashlib.sha1(f"{MODEL_NAME}:{text}".encode("utf-8")).hexdigest()
+
+def to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+def get_model():
+    """The sentence-transformer model, loaded once per process"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def warm_up():
+    """Load the model and ANN index before the first request needs them"""
+    get_model().encode(["warm up"], normalize_embeddings=True)
+    from src.utils.database import get_db_connection
+    conn = get_db_connection()
+    service_index(conn)
+    conn.close()
+
+def encode(texts):
+    """Encode a list of texts into L2-normalized float32 vectors"""
+    return np.asarray(get_model().encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+def normalize_query(text):
+    """Cache key for a query; the model's tokenizer is uncased, so lowercasing is lossless"""
+    return " ".join(text.lower().split())
+
+def encode_query(text):
+    """Embedding for a search query, served from ``query_cache`` when possible"""
+    key = normalize_query(text)
+    vector = query_cache.get(key)
+    if vector is None:
+        vector = encode([key])[0]
+        vector.setflags(write=False)
+        query_cache.set(key, vector)
+    return vector
+
+def _placeholders(values):
+    return ",".join("?" * len(values))
+
+def _chunks(values, size=500):
+    """Split id lists to stay well below SQLite's bound-parameter limit"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def store_embeddings(conn, services=(), resumes=()):
+    """Encode ``(service_id, text)`` and ``(user_id, resume)`` pairs in one model call"""
+    services, resumes = list(services), list(resumes)
+    # An empty resume has nothing to contribute to its seller's scores
+    cleared = [user_id for user_id, text in resumes if not (text or "").strip()]
+    resumes = [(user_id, text) for user_id, text in resumes if (text or "").strip()]
+
+    texts = [text for _, text in services] + [text for _, text in resumes]
+    vectors = encode(texts) if texts else []
+    service_vectors, resume_vectors = vectors[:len(services)], vectors[len(services):]
+
+    conn.executemany("""
+        INSERT OR REPLACE INTO service_embeddings (service_id, content_hash, embedding, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    """, [(service_id, text_hash(text), to_blob(vector))
+          for (service_id, text), vector in zip(services, service_vectors)])
+    conn.executemany("""
+        INSERT OR REPLACE INTO resume_embeddings (user_id, content_hash, embedding, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    """, [(user_id, text_hash(text), to_blob(vector))
+          for (user_id, text), vector in zip(resumes, resume_vectors)])
+    conn.executemany("DELETE FROM resume_embeddings WHERE user_id = ?",
+                     [(user_id,) for user_id in cleared])
+    conn.commit()
+
+    # A new resume vector changes the blended vector of every service the seller has
+    changed = {service_id for service_id, _ in services}
+    user_ids = [user_id for user_id, _ in resumes] + cleared
+    for chunk in _chunks(user_ids):
+        rows = conn.execute(f"SELECT id FROM services WHERE user_id IN ({_placeholders(chunk)})",
+                            chunk).fetchall()
+        changed.update(row[0] for row in rows)
+    return _publish(conn, changed)
+
+def store_service_embeddings(conn, services):
+    """Encode and persist embeddings for ``(service_id, text)`` pairs in one batch"""
+    return store_embeddings(conn, services=services)
+
+def refresh_embeddings(conn, service_ids=(), user_ids=()):
+    """Re-encode services and seller resumes by id from their current rows"""
+    services, resumes = [], []
+    for chunk in _chunks(service_ids):
+        rows = conn.execute(f"""
+            SELECT id, title, description FROM services WHERE id IN ({_placeholders(chunk)})
+        """, chunk).fetchall()
+        services.extend((row[0], service_text(row[1], row[2])) for row in rows)
+    for chunk in _chunks(user_ids):
+        rows = conn.execute(f"""
+            SELECT id, resume FROM users WHERE id IN ({_placeholders(chunk)})
+        """, chunk).fetchall()
+        resumes.extend((row[0], row[1]) for row in rows)
+    return store_embeddings(conn, services, resumes)
+
+def search_vectors(conn, service_ids=None, resume_weight=None):
+    """Blended vectors ``{service_id: (content_hash, vector)}`` used for scoring
+
+    Scores are ``(1 - w) * cos(query, service) + w * cos(query, resume)``.
+    That is linear, so it equals the dot product with
+    ``(1 - w) * service + w * resume``. Sellers without a resume are scored
+    on their service alone.
+    """
+    weight = RESUME_SCORE_WEIGHT if resume_weight is None else resume_weight
+    query = """
+        SELECT service_embeddings.service_id, service_embeddings.content_hash,
+               service_embeddings.embedding, resume_embeddings.embedding
+        FROM service_embeddings
+        JOIN services ON services.id = service_embeddings.service_id
+        LEFT JOIN resume_embeddings ON resume_embeddings.user_id = services.user_id
+    """
+    if service_ids is None:
+        batches = [conn.execute(query).fetchall()]
+    else:
+        batches = (conn.execute(f"{query} WHERE service_embeddings.service_id IN ({_placeholders(chunk)})",
+                                chunk).fetchall()
+                   for chunk in _chunks(service_ids))
+
+    vectors = {}
+    for rows in batches:
+        for row in rows:
+            vector = from_blob(row[2])
+            if row[3] is not None and weight:
+                vector = (1 - weight) * vector + weight * from_blob(row[3])
+            vectors[row[0]] = (row[1], vector)
+    return vectors
+
+def _publish(conn, service_ids):
+    """Push new blended vectors into the recommendation feeds
+
+    Search indexes, in this process and others, pick them up from
+    ``embedding_changes``.
+    """
+    vectors = {service_id: vector for service_id, (_, vector)
+               in search_vectors(conn, service_ids).items()}
+
+    from src.utils.recommendations import rescore_services
+    rescore_services(conn, vectors)
+    return vectors
+
+def delete_service_embedding(conn, service_id):
+    conn.execute("DELETE FROM service_embeddings WHERE service_id = ?", (service_id,))
+    conn.commit()
+
+    from src.utils.recommendations import remove_service
+    remove_service(conn, service_id)
+
+def service_index(conn):
+    """The vector index over every stored service embedding, as of the latest write
+
+    Built on first use, which also queues any services that were never
+    embedded; after that each call applies the ``embedding_changes`` made
+    since the last one, whichever process made them. It is only clustered
+    for the "ann" search backend.
+    """
+    global _index, _index_change_id
+    with _index_lock:
+        latest, oldest = conn.execute(
+            "SELECT COALESCE(MAX(id), 0), COALESCE(MIN(id), 0) FROM embedding_changes").fetchone()
+        if _index is None or oldest > _index_change_id + 1:
+            if _index is None:
+                from src.utils.embedding_jobs import enqueue_missing
+                enqueue_missing(conn)
+            index = VectorIndex(EMBEDDING_DIM, nprobe=ANN_NPROBE, clustered=SEARCH_BACKEND == "ann")
+            for service_id, (_, vector) in search_vectors(conn).items():
+                index.vectors[service_id] = vector
+            index.train()
+            _index, _index_change_id = index, latest
+        elif latest > _index_change_id:
+            rows = conn.execute("SELECT DISTINCT service_id FROM embedding_changes WHERE id > ? AND id <= ?",
+                                (_index_change_id, latest)).fetchall()
+            changed = [row[0] for row in rows]
+            vectors = search_vectors(conn, changed)
+            for service_id in changed:
+                if service_id in vectors:
+                    _index.add(service_id, vectors[service_id][1])
+                else:
+                    _index.remove(service_id)
+            _index_change_id = latest
+    return _index
+
+def prune_changes(conn, keep_seconds=CHANGES_KEEP_SECONDS):
+    """Drop old ``embedding_changes`` rows, always keeping the newest"""
+    conn.execute("""
+        DELETE FROM embedding_changes
+        WHERE changed_at < datetime('now', ?)
+        AND id < (SELECT MAX(id) FROM embedding_changes)
+    """, (f"-{int(keep_seconds)} seconds",))
+    conn.commit()
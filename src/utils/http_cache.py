@@ -0,0 +1,78 @@
+"""HTTP caching policy
+
+Pages are per-user and stay ``no-store``. Static files and uploads are
+linked through ``asset_url``, which adds a hash of the file's content, so a
+versioned URL always means the same bytes and can be cached for good. JSON
+APIs that are polled answer with an ETag built from a cheap version query,
+and return an empty ``304 Not Modified`` before doing the real query or any
+serialization when the client already has that version.
+"""
+import hashlib
+import os
+from flask import current_app, request
+from werkzeug.security import safe_join
+from src.config import STATIC_CACHE_SECONDS
+from src.utils.cache import LRUCache
+
+STATIC_PREFIX = "/static/"
+
+# (path, mtime, size) -> content hash, so each file is only read once per version
+_digests = LRUCache(maxsize=4096)
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def asset_url(url):
+    """``url`` with ``?v=<content hash>`` appended if it names a file under static/"""
+    if not url or not url.startswith(STATIC_PREFIX):
+        return url
+    path = safe_join(current_app.static_folder, url[len(STATIC_PREFIX):])
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    if stat is None:
+        return url
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        digest = file_digest(path)
+        _digests.set(key, digest)
+    return f"{url}?v={digest}"
+
+def make_etag(*parts):
+    """Strong ETag value for whatever identifies a response's content"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def revalidate(response, etag):
+    """Mark a per-user response as cacheable only after checking ``etag`` with us"""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def not_modified(etag):
+    """An empty 304 if the client already holds ``etag``, otherwise None"""
+    if etag not in request.if_none_match:
+        return None
+    return revalidate(current_app.response_class(status=304), etag)
+
+def apply_cache_policy(response):
+    """``after_request`` hook: long-lived static assets, no-store by default
+
+    Views that set their own Cache-Control (see ``revalidate``) keep it.
+    """
+    if request.endpoint == "static":
+        if request.args.get("v"):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_CACHE_SECONDS}, immutable"
+        else:
+            # Unversioned links still get 304s from the file's ETag/Last-Modified
+            response.headers["Cache-Control"] = "no-cache"
+    elif "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
+    return response
@@ -0,0 +1,82 @@
+"""Resized variants of uploaded service images
+
+``add_service`` stores the original upload and hands it to a small thread
+pool (Pillow releases the GIL while decoding, resizing and encoding), so the
+request returns straight away. Each image gets:
+
+- a thumbnail cropped to ``THUMBNAIL_SIZE`` for the catalogue grid
+- a WebP copy no larger than ``IMAGE_DISPLAY_MAX`` for the service page
+
+Both are written next to the original under ``variants/`` and recorded on the
+service row. Until they exist, or if the upload can't be decoded, pages fall
+back to the original image.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from src.config import UPLOAD_FOLDER, THUMBNAIL_SIZE, IMAGE_DISPLAY_MAX, IMAGE_WEBP_QUALITY, IMAGE_WORKERS
+from src.utils.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_FOLDER = os.path.join(UPLOAD_FOLDER, "variants")
+
+def variant_paths(path):
+    """Where the thumbnail and display WebP for the original at ``path`` go"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(VARIANTS_FOLDER, f"{stem}_thumb.webp"),
+            os.path.join(VARIANTS_FOLDER, f"{stem}.webp"))
+
+def make_variants(path):
+    """Write both variants for the image at ``path``; returns their paths"""
+    thumb_path, display_path = variant_paths(path)
+    # Uploads are stored by content hash, so a re-uploaded image already has them
+    if os.path.exists(thumb_path) and os.path.exists(display_path):
+        return thumb_path, display_path
+    os.makedirs(VARIANTS_FOLDER, exist_ok=True)
+    with Image.open(path) as original:
+        # JPEG can decode straight at a reduced scale, much faster for big photos
+        original.draft("RGB", (IMAGE_DISPLAY_MAX, IMAGE_DISPLAY_MAX))
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    image.thumbnail((IMAGE_DISPLAY_MAX, IMAGE_DISPLAY_MAX), Image.Resampling.LANCZOS)
+    image.save(display_path, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+    thumbnail = ImageOps.fit(image, THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    thumbnail.save(thumb_path, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+    return thumb_path, display_path
+
+def process_service_image(service_id, path):
+    """Build the variants for a service's image and record their URLs"""
+    try:
+        thumb_path, display_path = make_variants(path)
+    except Exception:
+        logger.exception("Could not build image variants for service %s", service_id)
+        return
+    conn = get_db_connection()
+    try:
+        # Only if the service still shows this image
+        conn.execute("""
+            UPDATE services SET thumbnail_url = ?, image_webp_url = ?
+            WHERE id = ? AND image_url = ?
+        """, (f"/{thumb_path}", f"/{display_path}", service_id, f"/{path}"))
+        conn.commit()
+    finally:
+        conn.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide image worker pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-worker")
+    return _pool
+
+def queue_service_image(service_id, path):
+    """Build a service's image variants in the background; returns a Future"""
+    return get_pool().submit(process_service_image, service_id, path)
@@ -0,0 +1,152 @@
+"""Group-commit write path for chat messages
+
+Each send is a message row plus a notification for the recipient. Rather
+than every request running its own transaction (and fsync), requests hand
+their send to a ``MessageWriter`` thread, which commits them in batches.
+Every request still waits for its own send to commit before it responds.
+
+A batch takes every send already queued, then waits up to
+``MESSAGE_COMMIT_WINDOW_MS`` for more, but only until it is as large as the
+previous batch. Sends that arrive while a batch commits are queued by the
+time the next one starts, so steady load batches itself without paying the
+window. The wait only runs when load grows past the previous batch size. A
+lone send (previous batch of one, nothing queued) commits at once, because
+waiting would add latency without adding a second send to the batch. The writer's
+connection uses the ``durable`` pragma profile (``synchronous=FULL``), so a
+success response means the message is on disk and visible to readers; the
+fsync is paid once per batch rather than once per send.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from src.config import MESSAGE_GROUP_COMMIT, MESSAGE_COMMIT_WINDOW_MS, MESSAGE_COMMIT_BATCH
+from src.utils.database import get_db_connection
+from src.utils.pubsub import publish, conversation_channel
+
+logger = logging.getLogger(__name__)
+
+# How long a request waits for its batch to commit before giving up
+SEND_TIMEOUT_SECONDS = 30
+
+def insert_message(conn, conversation_id, sender_id, recipient_id, message, notification):
+    """The two INSERTs of one send; returns the new message id"""
+    message_id = conn.execute("""
+        INSERT INTO chat_messages (conversation_id, sender_id, message)
+        VALUES (?, ?, ?)
+    """, (conversation_id, sender_id, message)).lastrowid
+    conn.execute("""
+        INSERT INTO notifications (user_id, message)
+        VALUES (?, ?)
+    """, (recipient_id, notification))
+    return message_id
+
+class MessageWriter(threading.Thread):
+    """Daemon thread that commits queued sends in batches"""
+
+    def __init__(self, window_ms=MESSAGE_COMMIT_WINDOW_MS, max_batch=MESSAGE_COMMIT_BATCH,
+                 profile="durable"):
+        super().__init__(name="message-writer", daemon=True)
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.profile = profile
+        self.sends = queue.Queue()
+        self.last_batch_size = 1
+
+    def submit(self, *send):
+        """Queue one send; the returned Future resolves to the message id once committed"""
+        future = Future()
+        self.sends.put((send, future))
+        return future
+
+    def next_batch(self):
+        """Block for one send, then gather more for up to the window
+
+        Queued sends always join, up to ``max_batch``. Waiting for more stops
+        at the window's end or once the batch is as large as the previous one.
+        """
+        batch = [self.sends.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Anything already queued joins without waiting
+                batch.append(self.sends.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or len(batch) >= self.last_batch_size:
+                break
+            try:
+                batch.append(self.sends.get(timeout=remaining))
+            except queue.Empty:
+                break
+        self.last_batch_size = len(batch)
+        return batch
+
+    def run(self):
+        conn = get_db_connection(self.profile)
+        while True:
+            batch = self.next_batch()
+            try:
+                results = self.write(conn, batch)
+            except Exception as e:
+                conn.rollback()
+                logger.exception("Message batch of %d send(s) failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (send, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            # Wake long-polling readers now that the messages are visible
+            for conversation_id in {send[0] for (send, _), result in zip(batch, results)
+                                    if not isinstance(result, Exception)}:
+                publish(conversation_channel(conversation_id))
+
+    def write(self, conn, batch):
+        """One transaction for the whole batch; a failing send only rolls back itself"""
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for send, _ in batch:
+            conn.execute("SAVEPOINT send")
+            try:
+                results.append(insert_message(conn, *send))
+            except Exception as e:
+                conn.execute("ROLLBACK TO send")
+                results.append(e)
+            conn.execute("RELEASE send")
+        conn.commit()
+        return results
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Start the process-wide message writer once"""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = MessageWriter()
+            _writer.start()
+    return _writer
+
+def send_message(conn, conversation_id, sender_id, recipient_id, message, notification):
+    """Store a message and its notification, returning once it has committed
+
+    With MESSAGE_GROUP_COMMIT off this writes and commits on ``conn``
+    directly, one transaction per send, with ``SQLITE_PRAGMA_PROFILE``'s
+    durability (under the default ``wal`` profile the last commits can be
+    lost on power failure).
+    """
+    if MESSAGE_GROUP_COMMIT:
+        future = get_writer().submit(conversation_id, sender_id, recipient_id, message, notification)
+        return future.result(timeout=SEND_TIMEOUT_SECONDS)
+
+    message_id = insert_message(conn, conversation_id, sender_id, recipient_id, message, notification)
+    conn.commit()
+    publish(conversation_channel(conversation_id))
+    return message_id
@@ -0,0 +1,445 @@
+"""Versioned schema migrations
+
+Each migration runs once, in version order, inside its own transaction, and
+is recorded in ``schema_migrations``. ``init_db()`` applies any pending ones
+at startup. Add new schema changes to the end of ``MIGRATIONS``; never
+renumber one that has shipped.
+
+Every statement must also be safe to run against a schema that already has
+it (``IF NOT EXISTS``, ``add_column``), so a database whose
+``schema_migrations`` rows were lost is brought back in line rather than
+failing at startup.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+def add_column(table, column, definition):
+    """``ALTER TABLE ... ADD COLUMN`` step that is skipped if the column exists"""
+    def apply(conn):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return apply
+
+MIGRATIONS = [
+    (1, "hot-path indexes", [
+        # Conversation history and the latest-message lookups, ordered by time
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation_time
+        ON chat_messages (conversation_id, timestamp)
+        """,
+        # Unread counts: messages in a conversation not sent by the reader
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_unread
+        ON chat_messages (conversation_id, is_read, sender_id)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversations_buyer ON conversations (buyer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_seller ON conversations (seller_id)",
+        "CREATE INDEX IF NOT EXISTS idx_services_user ON services (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_read ON notifications (user_id, is_read)",
+    ]),
+    # Give the query planner statistics for the new indexes
+    (2, "analyze", ["ANALYZE"]),
+    # One row per conversation participant with the latest message and their
+    # unread count, kept current by triggers so inboxes are a single range read
+    (3, "conversation summaries", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            last_message_id INTEGER,
+            last_timestamp DATETIME,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (conversation_id, user_id),
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversation_summaries_inbox
+        ON conversation_summaries (user_id, last_timestamp DESC)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversation_summaries_open AFTER INSERT ON conversations BEGIN
+            INSERT OR IGNORE INTO conversation_summaries (conversation_id, user_id)
+            VALUES (new.id, new.buyer_id), (new.id, new.seller_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversation_summaries_close AFTER DELETE ON conversations BEGIN
+            DELETE FROM conversation_summaries WHERE conversation_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversation_summaries_message AFTER INSERT ON chat_messages BEGIN
+            UPDATE conversation_summaries
+            SET last_message_id = new.id,
+                last_timestamp = new.timestamp,
+                unread_count = unread_count + (user_id != new.sender_id AND new.is_read = 0)
+            WHERE conversation_id = new.conversation_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversation_summaries_read AFTER UPDATE OF is_read ON chat_messages
+        WHEN old.is_read = 0 AND new.is_read = 1 BEGIN
+            UPDATE conversation_summaries SET unread_count = unread_count - 1
+            WHERE conversation_id = new.conversation_id AND user_id != new.sender_id;
+        END
+        """,
+        # Summaries for conversations that already exist
+        """
+        INSERT OR IGNORE INTO conversation_summaries
+            (conversation_id, user_id, last_message_id, last_timestamp, unread_count)
+        SELECT participants.conversation_id, participants.user_id, m.id, m.timestamp,
+               (SELECT COUNT(*) FROM chat_messages
+                WHERE conversation_id = participants.conversation_id
+                AND sender_id != participants.user_id AND is_read = 0)
+        FROM (
+            SELECT id AS conversation_id, buyer_id AS user_id FROM conversations
+            UNION
+            SELECT id, seller_id FROM conversations
+        ) participants
+        LEFT JOIN chat_messages m ON m.id = (
+            SELECT MAX(id) FROM chat_messages WHERE conversation_id = participants.conversation_id
+        )
+        """,
+    ]),
+    # Keyset paging over a conversation's messages by id (since_id / before_id)
+    (4, "chat message id index", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation_id
+        ON chat_messages (conversation_id, id)
+        """,
+    ]),
+    # Read state becomes a per-participant cursor instead of per-message is_read flags
+    (5, "read cursors", [
+        add_column("conversation_summaries", "last_read_message_id", "INTEGER NOT NULL DEFAULT 0"),
+        "DROP TRIGGER IF EXISTS conversation_summaries_read",
+        # Everything before a participant's first unread message counts as read;
+        # cursors already set are left alone if this runs again
+        """
+        UPDATE conversation_summaries SET last_read_message_id = COALESCE(
+            (SELECT MIN(id) - 1 FROM chat_messages
+             WHERE conversation_id = conversation_summaries.conversation_id
+             AND sender_id != conversation_summaries.user_id AND is_read = 0),
+            last_message_id, 0)
+        WHERE last_read_message_id = 0
+        """,
+        """
+        UPDATE conversation_summaries SET unread_count = (
+            SELECT COUNT(*) FROM chat_messages
+            WHERE conversation_id = conversation_summaries.conversation_id
+            AND id > conversation_summaries.last_read_message_id
+            AND sender_id != conversation_summaries.user_id)
+        """,
+    ]),
+    # Server-side sessions, keyed by the random id in the session cookie
+    (6, "sessions", [
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+    ]),
+    # Resized variants of the service image, filled in by the image workers
+    (7, "service image variants", [
+        add_column("services", "thumbnail_url", "TEXT"),
+        add_column("services", "image_webp_url", "TEXT"),
+    ]),
+    # Content-addressed uploads, reference counted by triggers on the columns
+    # that point at them; unreferenced ones are collected in the background
+    (8, "uploads", [
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            sha256 TEXT PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_uploads_orphans ON uploads (refcount, updated_at)",
+        add_column("users", "resume_url", "TEXT"),
+        """
+        CREATE TRIGGER IF NOT EXISTS uploads_service_insert AFTER INSERT ON services
+        WHEN new.image_url IS NOT NULL BEGIN
+            UPDATE uploads SET refcount = refcount + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = new.image_url;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS uploads_service_update AFTER UPDATE OF image_url ON services
+        WHEN old.image_url IS NOT new.image_url BEGIN
+            UPDATE uploads SET refcount = refcount - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = old.image_url;
+            UPDATE uploads SET refcount = refcount + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = new.image_url;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS uploads_service_delete AFTER DELETE ON services
+        WHEN old.image_url IS NOT NULL BEGIN
+            UPDATE uploads SET refcount = refcount - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = old.image_url;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS uploads_resume_update AFTER UPDATE OF resume_url ON users
+        WHEN old.resume_url IS NOT new.resume_url BEGIN
+            UPDATE uploads SET refcount = refcount - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = old.resume_url;
+            UPDATE uploads SET refcount = refcount + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = new.resume_url;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS uploads_resume_delete AFTER DELETE ON users
+        WHEN old.resume_url IS NOT NULL BEGIN
+            UPDATE uploads SET refcount = refcount - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE url = old.resume_url;
+        END
+        """,
+    ]),
+    # Latest resume extraction per user: pending, done or failed
+    (9, "resume jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS resume_jobs (
+            user_id INTEGER PRIMARY KEY,
+            resume_url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ]),
+    # Embeddings, the embedding job queue and recommendation rankings; these
+    # were created outside the migrations until now, hence IF NOT EXISTS
+    (10, "search tables", [
+        """
+        CREATE TABLE IF NOT EXISTS service_embeddings (
+            service_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (service_id) REFERENCES services(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS resume_embeddings (
+            user_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recommendation_feeds (
+            pref_key TEXT PRIMARY KEY,
+            query TEXT NOT NULL,
+            built_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recommendation_rankings (
+            pref_key TEXT NOT NULL,
+            service_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (pref_key, service_id),
+            FOREIGN KEY (service_id) REFERENCES services(id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_recommendation_rankings_score
+        ON recommendation_rankings (pref_key, score DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_recommendation_rankings_service
+        ON recommendation_rankings (service_id)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS embedding_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_jobs_pending
+        ON embedding_jobs (kind, target_id) WHERE status = 'pending'
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_embedding_jobs_status
+        ON embedding_jobs (status, id)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS service_index_status (
+            service_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (service_id) REFERENCES services(id)
+        )
+        """,
+        # Search filters: tag equality with a price range, or a price range alone
+        """
+        CREATE INDEX IF NOT EXISTS idx_services_tag_price ON services (tag, price)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_services_price ON services (price)
+        """,
+    ]),
+    # Full-text index over services plus the seller's resume; rowid is the
+    # service id. Until now this was created, and services missing from it
+    # indexed, on every startup.
+    (11, "services full-text index", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+            title, description, tag, resume,
+            tokenize = 'porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_fts_insert AFTER INSERT ON services BEGIN
+            INSERT INTO services_fts (rowid, title, description, tag, resume)
+            VALUES (new.id, new.title, new.description, new.tag,
+                    (SELECT resume FROM users WHERE id = new.user_id));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_fts_update AFTER UPDATE ON services BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+            INSERT INTO services_fts (rowid, title, description, tag, resume)
+            VALUES (new.id, new.title, new.description, new.tag,
+                    (SELECT resume FROM users WHERE id = new.user_id));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_fts_delete AFTER DELETE ON services BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_fts_resume AFTER UPDATE OF resume ON users BEGIN
+            UPDATE services_fts SET resume = new.resume
+            WHERE rowid IN (SELECT id FROM services WHERE user_id = new.id);
+        END
+        """,
+        # Index services that existed before the triggers did
+        """
+        INSERT INTO services_fts (rowid, title, description, tag, resume)
+        SELECT services.id, services.title, services.description, services.tag, users.resume
+        FROM services
+        JOIN users ON services.user_id = users.id
+        WHERE services.id NOT IN (SELECT rowid FROM services_fts)
+        """,
+    ]),
+    # Every write to a service's blended vector, so each process can bring
+    # its in-memory search index up to date with writes made by the others
+    (12, "embedding changes", [
+        """
+        CREATE TABLE IF NOT EXISTS embedding_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service_id INTEGER NOT NULL,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_embedding_changes_time ON embedding_changes (changed_at)",
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_service_insert
+        AFTER INSERT ON service_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id) VALUES (new.service_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_service_update
+        AFTER UPDATE ON service_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id) VALUES (new.service_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_service_delete
+        AFTER DELETE ON service_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id) VALUES (old.service_id);
+        END
+        """,
+        # A resume vector is blended into all of its seller's services
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_resume_insert
+        AFTER INSERT ON resume_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id)
+            SELECT id FROM services WHERE user_id = new.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_resume_update
+        AFTER UPDATE ON resume_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id)
+            SELECT id FROM services WHERE user_id = new.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS embedding_changes_resume_delete
+        AFTER DELETE ON resume_embeddings BEGIN
+            INSERT INTO embedding_changes (service_id)
+            SELECT id FROM services WHERE user_id = old.user_id;
+        END
+        """,
+    ]),
+    # Feed pages are ordered by score with the service id breaking ties
+    (13, "recommendation ranking order", [
+        "DROP INDEX IF EXISTS idx_recommendation_rankings_score",
+        """
+        CREATE INDEX IF NOT EXISTS idx_recommendation_rankings_order
+        ON recommendation_rankings (pref_key, score DESC, service_id DESC)
+        """,
+    ]),
+]
+
+def current_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+def migrate(conn):
+    """Apply every pending migration; returns the versions applied"""
+    applied = []
+    for version, name, statements in pending_migrations(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        # Another process may have applied it while we waited for the lock
+        if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+            conn.rollback()
+            continue
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                         (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied migration %d (%s)", version, name)
+        applied.append(version)
+    return applied
@@ -0,0 +1,148 @@
+"""Publish/subscribe for pushing chat activity to parked requests
+
+A long-poll request subscribes to a channel *before* checking the database
+and then waits on its subscription, so a message committed in between still
+wakes it. Publishers only signal that something changed; readers fetch the
+data themselves with their own cursor.
+
+``PUBSUB_BACKEND`` picks the implementation: ``"local"`` only reaches
+waiters in this process, ``"redis"`` fans out through Redis so a send
+handled by one worker process wakes waiters in all of them.
+"""
+import logging
+import threading
+import time
+from src.config import PUBSUB_BACKEND, REDIS_URL, PUBSUB_PREFIX
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """One waiter on one channel; use as a context manager"""
+
+    def __init__(self, bus, channel):
+        self.bus = bus
+        self.channel = channel
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        """Block until the channel is published to or ``timeout`` expires; True if published"""
+        return self.event.wait(timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class LocalPubSub:
+    """Channels and their subscriptions, held in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            waiters = self.channels.get(subscription.channel)
+            if waiters is not None:
+                waiters.discard(subscription)
+                if not waiters:
+                    del self.channels[subscription.channel]
+
+    def publish(self, channel):
+        with self.lock:
+            waiters = list(self.channels.get(channel, ()))
+        for subscription in waiters:
+            subscription.event.set()
+
+    def publish_all(self):
+        """Wake every waiter, e.g. after events may have been missed"""
+        with self.lock:
+            waiters = [s for subscriptions in self.channels.values() for s in subscriptions]
+        for subscription in waiters:
+            subscription.event.set()
+
+class RedisPubSub:
+    """Fan-out through Redis PUBLISH to every process using the same prefix
+
+    Each process holds one pattern subscription on a listener thread and
+    relays what it hears to its own ``LocalPubSub`` waiters. ``client`` can
+    be any redis-py compatible client, such as ``fakeredis.FakeRedis()``.
+    """
+
+    def __init__(self, client=None, url=REDIS_URL, prefix=PUBSUB_PREFIX):
+        if client is None:
+            # Only needed for this backend
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.local = LocalPubSub()
+        self.listening = threading.Event()
+        self.listener = threading.Thread(target=self.listen, name="pubsub-listener", daemon=True)
+        self.listener.start()
+        self.listening.wait(5)
+
+    def subscribe(self, channel):
+        return self.local.subscribe(channel)
+
+    def publish(self, channel):
+        try:
+            self.client.publish(self.prefix + channel, b"")
+        except Exception:
+            # The data is already committed; waiters still see it when their wait times out
+            logger.exception("Pub/sub publish failed")
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + "*")
+                self.listening.set()
+                # Anything published while we were (re)connecting was missed
+                self.local.publish_all()
+                for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    self.local.publish(channel[len(self.prefix):])
+            except Exception:
+                logger.exception("Pub/sub listener error")
+                time.sleep(1)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """The process-wide pub/sub backend, created on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = RedisPubSub() if PUBSUB_BACKEND == "redis" else LocalPubSub()
+    return _backend
+
+def set_backend(backend):
+    """Swap the process-wide backend (e.g. a RedisPubSub over fakeredis)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def subscribe(channel):
+    return get_backend().subscribe(channel)
+
+def publish(channel):
+    get_backend().publish(channel)
+
+def conversation_channel(conversation_id):
+    return f"conversation:{conversation_id}"
@@ -0,0 +1,99 @@
+"""Precomputed recommendation rankings for the buyer dashboard
+
+Every preference combination in use (at most one feed per ``SERVICE_TAGS``
+entry plus whatever combinations buyers have saved) gets a materialized
+ranking in ``recommendation_rankings``. The first request for a feed queues
+it for the embedding worker to build; after that it is kept current one
+service at a time whenever a service embedding is written or deleted, so
+``/buyer`` only reads an ordered list.
+"""
+import json
+import numpy as np
+from src.config import SERVICE_TAGS
+from src.utils.embeddings import encode_query, search_vectors
+from src.utils.embedding_jobs import enqueue_feed, enqueue_missing
+
+def preference_key(preferences):
+    """Stable key for a set of preference tags"""
+    return json.dumps(sorted(set(preferences)))
+
+def preference_query(preferences):
+    return " ".join(sorted(set(preferences)))
+
+def ensure_feed(conn, preferences):
+    """Key of the built ranking for ``preferences``, or None while it is being built
+
+    The first call for a combination queues the build; if that build
+    fails, the embedding worker queues it again (``retry_failed``).
+    """
+    key = preference_key(preferences)
+    row = conn.execute("SELECT built_at FROM recommendation_feeds WHERE pref_key = ?", (key,)).fetchone()
+    if row is not None:
+        return key if row[0] is not None else None
+
+    cursor = conn.execute("""
+        INSERT OR IGNORE INTO recommendation_feeds (pref_key, query, built_at) VALUES (?, ?, NULL)
+    """, (key, preference_query(preferences)))
+    conn.commit()
+    if cursor.rowcount:
+        enqueue_feed(conn, cursor.lastrowid)
+    return None
+
+def build_feeds(conn, feed_ids):
+    """Score the whole catalogue for the feeds with these rowids; runs on the embedding worker"""
+    feeds = [conn.execute("SELECT pref_key, query FROM recommendation_feeds WHERE rowid = ?",
+                          (feed_id,)).fetchone() for feed_id in feed_ids]
+    feeds = [feed for feed in feeds if feed is not None]
+    if not feeds:
+        return
+    # Services that were never embedded get ranked as their vectors arrive
+    enqueue_missing(conn)
+
+    vectors = search_vectors(conn)
+    ids = list(vectors)
+    matrix = np.vstack([vectors[i][1] for i in ids]) if ids else None
+    for key, query in feeds:
+        if matrix is not None:
+            scores = matrix @ encode_query(query)
+            conn.executemany("""
+                INSERT OR REPLACE INTO recommendation_rankings (pref_key, service_id, score)
+                VALUES (?, ?, ?)
+            """, [(key, service_id, float(score)) for service_id, score in zip(ids, scores)])
+        conn.execute("UPDATE recommendation_feeds SET built_at = CURRENT_TIMESTAMP WHERE pref_key = ?",
+                     (key,))
+    conn.commit()
+
+def rescore_services(conn, vectors):
+    """Update every materialized feed for ``{service_id: vector}``"""
+    if not vectors:
+        return
+    ids = list(vectors)
+    matrix = np.vstack([vectors[i] for i in ids])
+    feeds = conn.execute("SELECT pref_key, query FROM recommendation_feeds").fetchall()
+    for feed in feeds:
+        scores = matrix @ encode_query(feed[1])
+        conn.executemany("""
+            INSERT OR REPLACE INTO recommendation_rankings (pref_key, service_id, score)
+            VALUES (?, ?, ?)
+        """, [(feed[0], service_id, float(score)) for service_id, score in zip(ids, scores)])
+    conn.commit()
+
+def remove_service(conn, service_id):
+    conn.execute("DELETE FROM recommendation_rankings WHERE service_id = ?", (service_id,))
+    conn.commit()
+
+def prune_feeds(conn):
+    """Drop combination feeds no buyer uses any more; single-tag feeds are kept"""
+    in_use = {preference_key([tag]) for tag in SERVICE_TAGS}
+    for row in conn.execute("SELECT DISTINCT preferences FROM users WHERE preferences IS NOT NULL"):
+        try:
+            in_use.add(preference_key(json.loads(row[0])))
+        except (TypeError, ValueError):
+            continue
+
+    stale = [row[0] for row in conn.execute("SELECT pref_key FROM recommendation_feeds")
+             if row[0] not in in_use]
+    for key in stale:
+        conn.execute("DELETE FROM recommendation_rankings WHERE pref_key = ?", (key,))
+        conn.execute("DELETE FROM recommendation_feeds WHERE pref_key = ?", (key,))
+    conn.commit()
@@ -0,0 +1,199 @@
+"""Resume PDF text extraction off the request thread
+
+``upload_resume`` stores the PDF, records a ``pending`` row in ``resume_jobs``
+and hands the file to a small process pool, so a large or malformed PDF
+can't hold up a web worker. Each extraction is limited to
+``RESUME_MAX_PAGES`` pages, ``RESUME_MAX_CHARS`` characters and
+``RESUME_TIMEOUT_SECONDS`` of run time. When it completes, the job's
+callback saves the text to ``users.resume`` and queues the seller for
+re-embedding. If the seller has uploaded another resume in the meantime,
+the older result is dropped.
+
+Pool processes are spawned rather than forked, since the web process has
+other threads running.
+
+An extraction still ``pending`` well past its time limit was lost with the
+process that ran it (e.g. a restart). ``ResumeRecovery`` looks for those
+every ``RESUME_TIMEOUT_SECONDS`` in each web process. A process claims them
+before resubmitting, so only one worker takes each job.
+"""
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+import PyPDF2
+from src.config import RESUME_WORKERS, RESUME_TIMEOUT_SECONDS, RESUME_MAX_PAGES, RESUME_MAX_CHARS
+from src.utils.database import get_db_connection
+from src.utils.embedding_jobs import enqueue_user
+
+logger = logging.getLogger(__name__)
+
+class _Timeout(BaseException):
+    """Raised by the alarm; not an Exception, so PyPDF2's own handlers can't swallow it"""
+
+def _timed_out(signum, frame):
+    raise _Timeout
+
+def extract_pdf_text(path, max_pages=RESUME_MAX_PAGES, max_chars=RESUME_MAX_CHARS,
+                     timeout=RESUME_TIMEOUT_SECONDS):
+    """Text of the first ``max_pages`` pages, cut at ``max_chars``; runs in a pool process
+
+    The time limit uses SIGALRM, so it is only enforced where that exists
+    (not on Windows).
+    """
+    alarm = hasattr(signal, "SIGALRM")
+    if alarm:
+        signal.signal(signal.SIGALRM, _timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            reader = PyPDF2.PdfReader(path)
+            text = ""
+            for page in islice(reader.pages, max_pages):
+                text += page.extract_text() or ""
+                if len(text) >= max_chars:
+                    break
+            return text[:max_chars]
+        finally:
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Timeout:
+        raise TimeoutError(f"Extraction took longer than {timeout}s") from None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide extraction pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RESUME_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _discard_pool(pool):
+    """Drop a pool whose worker died so the next submit starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+def queue_resume(conn, user_id, path, resume_url):
+    """Extract the text of the PDF at ``path`` in the background"""
+    conn.execute("""
+        INSERT OR REPLACE INTO resume_jobs (user_id, resume_url, status, error, updated_at)
+        VALUES (?, ?, 'pending', NULL, CURRENT_TIMESTAMP)
+    """, (user_id, resume_url))
+    conn.commit()
+    pool = get_pool()
+    try:
+        future = pool.submit(extract_pdf_text, path)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = get_pool()
+        future = pool.submit(extract_pdf_text, path)
+    future.add_done_callback(lambda done: finish_resume(user_id, resume_url, done, pool))
+    return future
+
+def finish_resume(user_id, resume_url, future, pool):
+    """Completion callback: save the text, or record why there is none"""
+    conn = get_db_connection()
+    try:
+        try:
+            text = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _discard_pool(pool)
+            logger.exception("Resume extraction failed for user %s", user_id)
+            conn.execute("""
+                UPDATE resume_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND resume_url = ?
+            """, (str(e) or type(e).__name__, user_id, resume_url))
+            conn.commit()
+            return
+
+        # Only if this is still the seller's current resume
+        updated = conn.execute("UPDATE users SET resume = ? WHERE id = ? AND resume_url = ?",
+                               (text, user_id, resume_url)).rowcount
+        conn.execute("""
+            UPDATE resume_jobs SET status = 'done', updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ? AND resume_url = ?
+        """, (user_id, resume_url))
+        conn.commit()
+        if updated:
+            # The resume embedding feeds into every one of this seller's service scores
+            enqueue_user(conn, user_id)
+    finally:
+        conn.close()
+
+def claim_abandoned(conn, after_seconds=2 * RESUME_TIMEOUT_SECONDS):
+    """Atomically take over extractions left pending for ``after_seconds``
+
+    Touching ``updated_at`` claims a row, so another process looking at the
+    same time (or later, within ``after_seconds``) leaves it alone.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(f"""
+        SELECT user_id, resume_url FROM resume_jobs
+        WHERE status = 'pending'
+        AND updated_at < datetime('now', '-{int(after_seconds)} seconds')
+    """).fetchall()
+    conn.executemany("""
+        UPDATE resume_jobs SET updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ? AND resume_url = ?
+    """, [(row[0], row[1]) for row in rows])
+    conn.commit()
+    return rows
+
+def requeue_pending(conn):
+    """Resubmit extractions left pending by a process that exited mid-job"""
+    rows = claim_abandoned(conn)
+    for row in rows:
+        logger.info("Resubmitting abandoned resume extraction for user %s", row[0])
+        queue_resume(conn, row[0], row[1][1:], row[1])
+    return len(rows)
+
+class ResumeRecovery(threading.Thread):
+    """Daemon thread that resubmits abandoned extractions every ``interval`` seconds"""
+
+    def __init__(self, interval=RESUME_TIMEOUT_SECONDS):
+        super().__init__(name="resume-recovery", daemon=True)
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = get_db_connection()
+        while not self.stopping.is_set():
+            try:
+                requeue_pending(conn)
+            except Exception:
+                conn.rollback()
+                logger.exception("Resume recovery failed")
+            self.stopping.wait(self.interval)
+        conn.close()
+
+    def stop(self):
+        self.stopping.set()
+
+_recovery = None
+_recovery_lock = threading.Lock()
+
+def start_recovery():
+    """Start the process-wide resume recovery thread once"""
+    global _recovery
+    with _recovery_lock:
+        if _recovery is None or not _recovery.is_alive():
+            _recovery = ResumeRecovery()
+            _recovery.start()
+    return _recovery
+
+def resume_status(conn, user_id):
+    """``(status, error)`` of the user's latest extraction, or ``(None, None)``"""
+    row = conn.execute("SELECT status, error FROM resume_jobs WHERE user_id = ?",
+                       (user_id,)).fetchone()
+    return (row["status"], row["error"]) if row else (None, None)
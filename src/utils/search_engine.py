@@ -1,24 +1,170 @@
-"""Search engine for freelance posts using semantic similarity"""
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
+"""Search engine for freelance posts using semantic similarity, BM25 keywords or both"""
+import re
+import numpy as np
+from src.config import (
+    SEARCH_BACKEND, HYBRID_FUSION, HYBRID_SEMANTIC_WEIGHT, HYBRID_KEYWORD_WEIGHT, HYBRID_CANDIDATES
+)
+from src.utils.ann_index import top_k
+from src.utils.database import get_db
+from src.utils.embeddings import encode_query, service_index
 
 class SearchQuery:
-    def __init__(self, items):
-        self.items = items
-        self.text = [f"TITLE: {item.title}. DESCRIPTION: {item.description}. SELLER'S RESUME: {item.resume or ''}" for item in items]
-
-    def search(self, query):
-        query_embedding = model.encode(query, normalize_embeddings=True)
-        text_embedding = model.encode(self.text, normalize_embeddings=True)
-        if text_embedding is None or len(text_embedding) == 0:
-            print("DEBUG: No text embeddings available.")
+    """Semantic ranking of services as ``(service_id, score)`` pairs
+
+    Scores come from the process-wide vector index, which holds every stored
+    vector in memory and is kept in sync by ``service_index``, so a search
+    reads no embeddings from SQLite. ``filters`` is a ``filter_clause()``
+    result; only the ids of the services it selects are read, and without it
+    the whole catalogue is searched.
+    """
+
+    def __init__(self, filters=None, backend=None):
+        self.filters = filters
+        # "exact" scores every candidate; "ann" asks the IVF index for candidates when a limit is given
+        self.backend = backend or SEARCH_BACKEND
+
+    def candidate_ids(self, db):
+        """Ids selected by the filters, or None when every service is a candidate"""
+        where, params = self.filters or ("1", [])
+        if where == "1":
+            return None
+        rows = db.execute(f"SELECT services.id FROM services WHERE {where} ORDER BY services.id",
+                          params).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query, limit=None, offset=0):
+        """Rank services by similarity to ``query``, returning ``limit`` results from ``offset``
+
+        With a limit only the best ``offset + limit`` services are selected
+        and sorted; without one every candidate is ranked.
+        """
+        db = get_db()
+        index = service_index(db)
+        ids = self.candidate_ids(db)
+        if not len(index) or ids == []:
+            return []
+        query_embedding = encode_query(query)
+        k = offset + limit if limit is not None else None
+
+        if self.backend == "ann" and k is not None:
+            ranked = self.search_index(index, query_embedding, k, ids)
+            if ranked is not None:
+                return ranked[offset:]
+        # Embeddings are L2-normalized, so the dot product is the cosine similarity
+        return index.search(query_embedding, k, exact=True, ids=ids)[offset:]
+
+    def search_index(self, index, query_embedding, k, ids):
+        """Top-k through the IVF clusters, or None when they cannot fill k from ``ids``"""
+        if ids is None:
+            return index.search(query_embedding, k)
+        # A narrow filtered candidate set is cheaper to score exactly than to dig out of the index
+        if 2 * len(ids) < len(index):
+            return None
+        # The index covers the whole catalogue; over-fetch by the services it holds that we don't
+        wanted = set(ids)
+        fetch = k + max(len(index) - len(wanted), 0)
+        ranked = [(i, score) for i, score in index.search(query_embedding, fetch) if i in wanted]
+        if len(ranked) < min(k, len(wanted)):
+            return None
+        return ranked[:k]
+
+# bm25() weights for the services_fts columns: title, description, tag, resume
+KEYWORD_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+def fts_query(text):
+    """FTS5 MATCH expression matching any word of free text
+
+    Each word is quoted so punctuation and FTS5 operators typed by a user
+    can't produce a syntax error.
+    """
+    return " OR ".join(f'"{word}"' for word in re.findall(r"\w+", text.lower()))
+
+def filter_clause(min_price=None, max_price=None, tag=None):
+    """WHERE condition on ``services`` for the search filters, as ``(sql, params)``
+
+    The conditions are served by the ``(tag, price)`` and ``price`` indexes,
+    so a narrow filter reads only the matching rows.
+    """
+    conditions, params = [], []
+    if tag:
+        conditions.append("services.tag = ?")
+        params.append(tag)
+    if min_price is not None:
+        conditions.append("services.price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("services.price <= ?")
+        params.append(max_price)
+    return " AND ".join(conditions) or "1", params
+
+def keyword_search(conn, query, limit=-1, offset=0, filters=None):
+    """BM25-ranked ``(service_id, score)`` pairs from ``services_fts``, best first
+
+    ``filters`` is a ``filter_clause()`` result applied to the matching services.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    where, params = filters or ("1", [])
+    # bm25() is lower-is-better, so negate it for a higher-is-better score
+    rows = conn.execute(f"""
+        SELECT services_fts.rowid,
+               -bm25(services_fts, {", ".join(map(str, KEYWORD_WEIGHTS))}) AS score
+        FROM services_fts
+        JOIN services ON services.id = services_fts.rowid
+        WHERE services_fts MATCH ? AND {where}
+        ORDER BY score DESC, services_fts.rowid DESC
+        LIMIT ? OFFSET ?
+    """, (match, *params, limit, offset)).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+# Reciprocal-rank-fusion damping constant from Cormack et al.
+RRF_K = 60
+
+class HybridSearch:
+    """Lexical and semantic search fused into one ranking
+
+    Keyword candidates come from the FTS5 index and semantic candidates from
+    the stored vectors; each list is cut to ``candidates`` before fusing.
+    ``fusion="rrf"`` sums ``weight / (RRF_K + rank)`` over both lists, while
+    ``fusion="weighted"`` min-max normalizes each list's scores and takes
+    the weighted sum. Either way the fusion is a handful of NumPy array ops.
+    ``filters`` is a ``filter_clause()`` result applied to both lists.
+    """
+
+    def __init__(self, fusion=None, semantic_weight=None, keyword_weight=None,
+                 candidates=HYBRID_CANDIDATES, filters=None):
+        self.filters = filters
+        self.fusion = fusion or HYBRID_FUSION
+        self.semantic_weight = HYBRID_SEMANTIC_WEIGHT if semantic_weight is None else semantic_weight
+        self.keyword_weight = HYBRID_KEYWORD_WEIGHT if keyword_weight is None else keyword_weight
+        self.candidates = candidates
+
+    def search(self, query, limit=None, offset=0):
+        semantic = SearchQuery(self.filters).search(query, limit=self.candidates)
+        lexical = keyword_search(get_db(), query, limit=self.candidates, filters=self.filters)
+
+        ids = list(dict.fromkeys([i for i, _ in semantic] + [i for i, _ in lexical]))
+        if not ids:
             return []
-        similarities = cosine_similarity([query_embedding], text_embedding)[0]
-        # Sorted expects key to be a function
-        # reverse = True because we want top cosine similarity value first
-        ranked = sorted(
-            zip(self.items, similarities), key=lambda x: x[1], reverse=True
-        )
-        return ranked
+        position = {service_id: n for n, service_id in enumerate(ids)}
+        fused = (self.semantic_weight * self.component(semantic, position, len(ids))
+                 + self.keyword_weight * self.component(lexical, position, len(ids)))
+
+        k = offset + limit if limit is not None else None
+        return top_k(ids, fused, k)[offset:]
+
+    def component(self, ranked, position, size):
+        """One candidate list spread over the union of candidates; absent ids score 0"""
+        values = np.zeros(size, dtype=np.float32)
+        if not ranked:
+            return values
+        slots = np.fromiter((position[i] for i, _ in ranked), dtype=np.intp, count=len(ranked))
+        if self.fusion == "weighted":
+            scores = np.fromiter((score for _, score in ranked), dtype=np.float32, count=len(ranked))
+            spread = scores.max() - scores.min()
+            values[slots] = (scores - scores.min()) / spread if spread else 1.0
+        else:
+            # Lists arrive best first, so list order is the rank
+            values[slots] = 1.0 / (RRF_K + np.arange(1, len(ranked) + 1, dtype=np.float32))
+        return values
@@ -0,0 +1,172 @@
+"""Session storage
+
+``SESSION_BACKEND`` picks where session data lives (see ``init_sessions``).
+The default, ``SqliteSessionInterface``, keeps only a random id in the cookie
+and the data in the ``sessions`` table. A row is only rewritten when the
+session changes or its expiry needs pushing forward, and expired rows are
+swept periodically.
+
+Signing in (``user_id`` changing) always moves the session to a new id, so
+an id planted before login is worthless. Sessions without a signed-in user
+are cached in memory; signed-in ones are read from the table every time,
+because another worker process may have deleted them (logout) and this
+process's cache would not know.
+"""
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from src.config import (SESSION_CACHE_SIZE, SESSION_CACHE_TTL,
+                        SESSION_REFRESH_SECONDS, SESSION_SWEEP_SECONDS)
+from src.utils.cache import LRUCache
+from src.utils.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Keys that mark a session as signed in
+AUTH_KEYS = ("user_id",)
+
+def is_authenticated(data):
+    return any(key in data for key in AUTH_KEYS)
+
+class ServerSession(SecureCookieSession):
+    """Session dict that knows its id, when its stored row expires and who it was loaded for"""
+
+    def __init__(self, initial=None, sid=None, expires_at=0, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        # dict.get: reading it here must not mark the session accessed
+        self.loaded_user_id = dict.get(self, "user_id")
+
+class SqliteSessionInterface(SessionInterface):
+    """Sessions in the ``sessions`` table behind an in-process LRU cache"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, cache_size=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL,
+                 refresh_seconds=SESSION_REFRESH_SECONDS, sweep_seconds=SESSION_SWEEP_SECONDS):
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl) if cache_size else None
+        self.refresh_seconds = refresh_seconds
+        self.sweep_seconds = sweep_seconds
+        self.next_sweep = 0
+        self.sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.load(sid)
+            if entry is not None:
+                data, expires_at = entry
+                return ServerSession(data, sid=sid, expires_at=expires_at)
+        # Unknown or expired ids are never reused, so a planted cookie can't fix the id
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        now = time.time()
+        self.sweep(now)
+
+        if not session:
+            # Emptied (e.g. logout): drop the row and the cookie; never-used sessions aren't stored
+            if not session.new:
+                self.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+
+        if not session.new and session.get("user_id") != session.loaded_user_id:
+            # Signed in or switched user: continue under a fresh id (no session fixation)
+            self.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        written_at = session.expires_at - lifetime
+        if not (session.new or session.modified or now - written_at >= self.refresh_seconds):
+            return
+
+        expires_at = now + lifetime
+        self.store(session.sid, dict(session), expires_at)
+        expires = None
+        if app.config.get("SESSION_PERMANENT", True):
+            expires = datetime.fromtimestamp(expires_at, timezone.utc)
+        response.set_cookie(name, session.sid, expires=expires, httponly=httponly,
+                            domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add("Cookie")
+
+    def load(self, sid):
+        """``(data, expires_at)`` for a live session, or None"""
+        entry = self.cache.get(sid) if self.cache is not None else None
+        if entry is None:
+            row = get_db().execute("SELECT data, expires_at FROM sessions WHERE id = ?",
+                                   (sid,)).fetchone()
+            if row is None:
+                return None
+            entry = (self.serializer.loads(row["data"]), row["expires_at"])
+            if self.cache is not None and not is_authenticated(entry[0]):
+                self.cache.set(sid, entry)
+        if entry[1] <= time.time():
+            return None
+        return entry
+
+    def store(self, sid, data, expires_at):
+        db = get_db()
+        db.execute("""
+            INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        """, (sid, self.serializer.dumps(data), expires_at))
+        db.commit()
+        if self.cache is not None:
+            if is_authenticated(data):
+                self.cache.pop(sid)
+            else:
+                self.cache.set(sid, (data, expires_at))
+
+    def delete(self, sid):
+        if self.cache is not None:
+            self.cache.pop(sid)
+        db = get_db()
+        db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        db.commit()
+
+    def sweep(self, now):
+        """Delete expired rows, at most once every ``sweep_seconds``"""
+        with self.sweep_lock:
+            if now < self.next_sweep:
+                return
+            self.next_sweep = now + self.sweep_seconds
+        db = get_db()
+        swept = db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        db.commit()
+        if swept:
+            logger.debug("Swept %d expired sessions", swept)
+
+def init_sessions(app):
+    """Install the session backend named by ``SESSION_BACKEND`` on ``app``"""
+    backend = app.config["SESSION_BACKEND"]
+    if backend == "sqlite":
+        app.session_interface = SqliteSessionInterface()
+    elif backend == "cookie":
+        # Flask's own signed cookie; the payload is only a few ids
+        app.session_interface = SecureCookieSessionInterface()
+    elif backend == "filesystem":
+        # Only needed for this backend
+        from flask_session import Session
+        Session(app)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
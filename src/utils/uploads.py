@@ -0,0 +1,283 @@
+"""Upload streaming and content-addressed storage
+
+Upload endpoints are wrapped in ``upload_limit``, which caps the request
+body (bodies that declare a larger Content-Length get a 413 before any of
+it is read) and streams each file part through ``UploadStream``. That
+writes straight to a temporary file while hashing it, and rejects a part
+as soon as it grows past the per-file limit or its first bytes don't
+match its file extension.
+
+``store_upload`` then keeps the file at ``UPLOAD_FOLDER/<sha[:2]>/<sha><ext>``,
+so identical uploads share a single file. Each stored file has a row in
+``uploads`` whose ``refcount`` is maintained by triggers on the columns
+that point at it (``services.image_url`` and ``users.resume_url``).
+
+Files whose count has dropped to zero (e.g. after ``delete_service``) are
+removed by ``UploadCollector`` in the background, once they have been
+unreferenced for ``UPLOAD_GC_GRACE_SECONDS``. The grace period covers the
+moment between storing a file and saving the row that references it.
+"""
+import codecs
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from flask import Request, request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from src.config import UPLOAD_FOLDER, UPLOAD_GC_SECONDS, UPLOAD_GC_GRACE_SECONDS
+from src.utils.database import get_db_connection
+from src.utils.images import variant_paths
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Room for the non-file fields of an upload form on top of its file limit
+FORM_FIELDS_BYTES = 1024 * 1024
+# Enough leading bytes to recognise every type below
+SNIFF_BYTES = 16
+
+def sniff(head):
+    """The kind of file ``head`` (its first bytes) starts, or None"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if text_encoding(head):
+        return "text"
+    return None
+
+# Longest first, so a UTF-32-LE mark isn't read as UTF-16-LE
+TEXT_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+def text_encoding(head):
+    """Encoding of the text file that starts with ``head``, or None if it isn't text
+
+    Files with a byte order mark are taken at their word. Without one, text
+    with no NUL bytes is read as UTF-8, and otherwise ``head`` has to decode
+    to printable characters as UTF-16 or UTF-32.
+    """
+    for bom, encoding in TEXT_BOMS:
+        if head.startswith(bom):
+            return encoding
+    if b"\x00" not in head:
+        return "utf-8"
+    for encoding in ("utf-32-le", "utf-32-be", "utf-16-le", "utf-16-be"):
+        try:
+            # Not final: the head may end part-way through a character
+            text = codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+        except UnicodeDecodeError:
+            continue
+        if text and all(c.isprintable() or c in "\t\r\n" for c in text):
+            return encoding
+    return None
+
+# What each accepted extension's content must sniff as
+EXTENSION_KINDS = {
+    "png": "png", "jpg": "jpeg", "jpeg": "jpeg", "gif": "gif", "webp": "webp",
+    "pdf": "pdf", "txt": "text",
+}
+
+class UploadStream:
+    """Temporary file for one uploaded file, hashed and checked as it is written
+
+    ``max_bytes`` and ``extensions`` may be None for no limit / any type.
+    """
+
+    def __init__(self, filename=None, max_bytes=None, extensions=None):
+        self.ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+        self.max_bytes = max_bytes
+        # Browsers send an empty part with no filename when no file was picked
+        self.expected = None
+        if extensions is not None and filename:
+            if self.ext not in extensions:
+                raise UnsupportedMediaType(f"Files of type '.{self.ext}' can't be uploaded here")
+            self.expected = EXTENSION_KINDS.get(self.ext)
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=UPLOAD_FOLDER, prefix=".upload-", delete=False)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.checked = self.expected is None
+        self.detached = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Files here can be at most {self.max_bytes // 1024} KB")
+        if not self.checked:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.check_type()
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def check_type(self):
+        self.checked = True
+        if self.size and sniff(self.head) != self.expected:
+            raise UnsupportedMediaType(f"That file's contents don't match '.{self.ext}'")
+
+    def seek(self, *args):
+        # Written in full; a file shorter than SNIFF_BYTES is checked now
+        if not self.checked:
+            self.check_type()
+        return self.file.seek(*args)
+
+    def detach(self):
+        """Close the file and hand over its path; it is no longer deleted on close"""
+        self.file.close()
+        self.detached = True
+        return self.file.name
+
+    def close(self):
+        self.file.close()
+        if not self.detached and os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    """Request whose file parts go through ``UploadStream`` (see ``upload_limit``)"""
+
+    upload_max_bytes = None
+    upload_extensions = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = UploadStream(filename, self.upload_max_bytes, self.upload_extensions)
+        # Kept here too: a part rejected mid-parse never reaches request.files
+        self.__dict__.setdefault("upload_streams", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.pop("upload_streams", ()):
+            stream.close()
+
+def upload_limit(max_bytes, extensions):
+    """Limit a view's uploaded files to ``max_bytes`` each and to ``extensions``
+
+    Needs ``app.request_class = UploadRequest``. Applies from the moment
+    the view first touches ``request.form`` or ``request.files``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            request.max_content_length = max_bytes + FORM_FIELDS_BYTES
+            request.upload_max_bytes = max_bytes
+            request.upload_extensions = set(extensions)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+def upload_path(digest, ext):
+    return os.path.join(UPLOAD_FOLDER, digest[:2], f"{digest}{ext}")
+
+def store_upload(conn, file, ext):
+    """Store a FileStorage's content, returning the path it is kept at
+
+    ``ext`` (e.g. ``".png"``) only names a newly stored file; content that
+    is already stored keeps its existing path.
+    """
+    stream = file.stream
+    if not isinstance(stream, UploadStream):
+        # Not parsed by UploadRequest, so copy it through one
+        stream = UploadStream()
+        try:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b""):
+                stream.write(chunk)
+        except Exception:
+            stream.close()
+            raise
+    digest = stream.digest.hexdigest()
+    size = stream.size
+    tmp_name = stream.detach()
+
+    try:
+        # Touching updated_at restarts the grace period of a file awaiting collection
+        conn.execute("""
+            INSERT INTO uploads (sha256, url, size) VALUES (?, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+        """, (digest, f"/{upload_path(digest, ext)}", size))
+        conn.commit()
+        path = conn.execute("SELECT url FROM uploads WHERE sha256 = ?", (digest,)).fetchone()[0][1:]
+        if os.path.exists(path):
+            logger.debug("Upload %s already stored, deduplicated", digest[:12])
+            os.unlink(tmp_name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_name, path)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return path
+
+def collect_orphans(conn, grace_seconds=UPLOAD_GC_GRACE_SECONDS):
+    """Delete uploads nothing has referenced for ``grace_seconds``; returns how many
+
+    Files are unlinked before the rows' deletion commits, so a concurrent
+    ``store_upload`` of the same content waits and then writes a new copy.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("""
+            SELECT sha256, url FROM uploads
+            WHERE refcount <= 0 AND updated_at <= datetime('now', ?)
+        """, (f"-{int(grace_seconds)} seconds",)).fetchall()
+        for row in rows:
+            path = row["url"][1:]
+            for stale in (path, *variant_paths(path)):
+                if os.path.exists(stale):
+                    os.unlink(stale)
+        conn.executemany("DELETE FROM uploads WHERE sha256 = ?", [(row["sha256"],) for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if rows:
+        logger.info("Collected %d orphaned uploads", len(rows))
+    return len(rows)
+
+class UploadCollector(threading.Thread):
+    """Daemon thread that collects orphaned uploads every ``UPLOAD_GC_SECONDS``"""
+
+    def __init__(self, interval=UPLOAD_GC_SECONDS):
+        super().__init__(name="upload-collector", daemon=True)
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = get_db_connection()
+        while not self.stopping.is_set():
+            try:
+                collect_orphans(conn)
+            except Exception:
+                logger.exception("Upload collection failed")
+            self.stopping.wait(self.interval)
+        conn.close()
+
+    def stop(self):
+        self.stopping.set()
+
+_collector = None
+_collector_lock = threading.Lock()
+
+def start_collector():
+    """Start the process-wide upload collector once"""
+    global _collector
+    with _collector_lock:
+        if _collector is None or not _collector.is_alive():
+            _collector = UploadCollector()
+            _collector.start()
+    return _collector
@@ -0,0 +1,80 @@
+"""MessageWriter.next_batch: how long a batch waits for more sends
+
+The writer thread is never started; sends are queued by hand and
+``next_batch`` is called directly, so no database is involved.
+"""
+import threading
+import time
+import unittest
+from src.utils.message_writer import MessageWriter
+
+WINDOW_MS = 200
+
+class NextBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.writer = MessageWriter(window_ms=WINDOW_MS, max_batch=8)
+
+    def queue(self, count):
+        for n in range(count):
+            self.writer.submit(n)
+
+    def queue_later(self, count, delay):
+        timer = threading.Timer(delay, self.queue, (count,))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def timed_batch(self):
+        started = time.monotonic()
+        batch = self.writer.next_batch()
+        return len(batch), time.monotonic() - started
+
+    def test_lone_send_commits_at_once(self):
+        self.queue(1)
+        size, elapsed = self.timed_batch()
+        self.assertEqual(size, 1)
+        self.assertLess(elapsed, WINDOW_MS / 1000 / 2)
+
+    def test_queued_sends_join_without_waiting(self):
+        self.queue(5)
+        size, elapsed = self.timed_batch()
+        self.assertEqual(size, 5)
+        self.assertLess(elapsed, WINDOW_MS / 1000 / 2)
+
+    def test_batch_is_capped(self):
+        self.queue(12)
+        self.assertEqual(len(self.writer.next_batch()), 8)
+        self.assertEqual(len(self.writer.next_batch()), 4)
+
+    def test_waits_until_previous_batch_size(self):
+        self.queue(4)
+        self.writer.next_batch()
+        self.queue(1)
+        # Arrives within the window, so it joins the lone queued send
+        self.queue_later(3, 0.05)
+        size, elapsed = self.timed_batch()
+        self.assertEqual(size, 4)
+        self.assertLess(elapsed, WINDOW_MS / 1000)
+
+    def test_waits_out_window_when_load_drops(self):
+        self.queue(4)
+        self.writer.next_batch()
+        self.queue(1)
+        size, elapsed = self.timed_batch()
+        self.assertEqual(size, 1)
+        self.assertGreaterEqual(elapsed, WINDOW_MS / 1000 * 0.9)
+        # Having shrunk to one, the next lone send no longer waits
+        self.queue(1)
+        size, elapsed = self.timed_batch()
+        self.assertEqual(size, 1)
+        self.assertLess(elapsed, WINDOW_MS / 1000 / 2)
+
+    def test_send_after_window_is_left_for_next_batch(self):
+        self.queue(4)
+        self.writer.next_batch()
+        self.queue(1)
+        self.queue_later(1, WINDOW_MS / 1000 * 2)
+        size, _ = self.timed_batch()
+        self.assertEqual(size, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""RedisPubSub over an in-memory fake Redis shared by several "processes"
+
+Each ``RedisPubSub`` gets its own ``FakeRedis`` client, and the clients
+share one ``FakeServer``, so a publish from one backend has to travel
+through the listener thread of another, as it would between workers.
+"""
+import fnmatch
+import queue
+import threading
+import time
+import unittest
+from src.utils.pubsub import RedisPubSub
+
+class FakeServer:
+    """Pattern subscriptions and the messages published to them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def publish(self, channel, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        receivers = 0
+        for pubsub in subscribers:
+            for pattern in pubsub.patterns:
+                if fnmatch.fnmatchcase(channel, pattern):
+                    pubsub.messages.put({"type": "pmessage", "pattern": pattern.encode(),
+                                         "channel": channel.encode(), "data": data})
+                    receivers += 1
+        return receivers
+
+    def disconnect(self):
+        """Drop every connection, as a Redis restart would"""
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for pubsub in subscribers:
+            pubsub.messages.put(ConnectionError("Connection closed by server"))
+
+class FakePubSub:
+    def __init__(self, server, ignore_subscribe_messages=False):
+        self.server = server
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.patterns = []
+        self.messages = queue.Queue()
+
+    def psubscribe(self, pattern):
+        self.patterns.append(pattern)
+        with self.server.lock:
+            self.server.subscribers.append(self)
+        if not self.ignore_subscribe_messages:
+            self.messages.put({"type": "psubscribe", "pattern": None,
+                               "channel": pattern.encode(), "data": len(self.patterns)})
+
+    def listen(self):
+        while True:
+            message = self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+class FakeRedis:
+    """The part of redis-py's client that RedisPubSub uses"""
+
+    def __init__(self, server):
+        self.server = server
+        self.fail = False
+
+    def publish(self, channel, data):
+        if self.fail:
+            raise ConnectionError("Error connecting to Redis")
+        return self.server.publish(channel, data)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self.server, ignore_subscribe_messages)
+
+class RedisPubSubTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.sender = RedisPubSub(client=FakeRedis(self.server), prefix="test:")
+        self.receiver = RedisPubSub(client=FakeRedis(self.server), prefix="test:")
+
+    def test_publish_wakes_waiter_in_other_process(self):
+        with self.receiver.subscribe("conversation:1") as subscription:
+            self.sender.publish("conversation:1")
+            self.assertTrue(subscription.wait(2))
+
+    def test_publish_wakes_waiter_in_same_process(self):
+        with self.sender.subscribe("conversation:1") as subscription:
+            self.sender.publish("conversation:1")
+            self.assertTrue(subscription.wait(2))
+
+    def test_other_channel_does_not_wake(self):
+        with self.receiver.subscribe("conversation:1") as subscription:
+            self.sender.publish("conversation:2")
+            self.assertFalse(subscription.wait(0.2))
+
+    def test_wait_times_out(self):
+        with self.receiver.subscribe("conversation:1") as subscription:
+            started = time.monotonic()
+            self.assertFalse(subscription.wait(0.3))
+            self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_prefixes_are_isolated(self):
+        other = RedisPubSub(client=FakeRedis(self.server), prefix="other:")
+        with other.subscribe("conversation:1") as subscription:
+            self.sender.publish("conversation:1")
+            self.assertFalse(subscription.wait(0.2))
+
+    def test_closed_subscription_is_dropped(self):
+        subscription = self.receiver.subscribe("conversation:1")
+        subscription.close()
+        self.assertEqual(self.receiver.local.channels, {})
+
+    def test_publish_failure_is_logged_not_raised(self):
+        self.sender.client.fail = True
+        with self.assertLogs("src.utils.pubsub", level="ERROR"):
+            self.sender.publish("conversation:1")
+
+    def test_reconnect_wakes_every_waiter(self):
+        # A message published while the listener was disconnected is lost, so
+        # resubscribing wakes everyone to re-read the database
+        with self.receiver.subscribe("conversation:1") as subscription, \
+                self.assertLogs("src.utils.pubsub", level="ERROR"):
+            self.server.disconnect()
+            self.assertTrue(subscription.wait(5))
+
+if __name__ == "__main__":
+    unittest.main()